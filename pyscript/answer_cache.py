@@ -0,0 +1,90 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+
+class SemanticAnswerCache:
+    """In-process cache of chatbot answers keyed by query embedding.
+
+    A lookup returns the stored answer of the most similar previous query, with the
+    retrieval results it was generated from, when its cosine similarity is at least the
+    threshold. Entries expire after the TTL and the least recently used entry is evicted
+    once the cache is full."""
+
+    def __init__(self,
+                 threshold: Optional[float] = None,
+                 ttl_seconds: Optional[float] = None,
+                 max_entries: Optional[int] = None):
+        self.threshold = threshold if threshold is not None else float(os.getenv("CHAT_CACHE_THRESHOLD", 0.95))
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.getenv("CHAT_CACHE_TTL", 24 * 3600))
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv("CHAT_CACHE_SIZE", 1000))
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._next_id = 0
+        self._lookups = 0
+        self._hits = 0
+
+    def _expire(self, now: float):
+        expired = [entry_id for entry_id, entry in self._entries.items() if now - entry["created_at"] > self.ttl_seconds]
+        for entry_id in expired:
+            del self._entries[entry_id]
+
+    def lookup(self, embedding: List[float]) -> Optional[Tuple[str, List[Dict]]]:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        with self._lock:
+            self._lookups += 1
+            self._expire(time.time())
+            if not self._entries or norm == 0:
+                return None
+            entry_ids = list(self._entries)
+            matrix = np.stack([self._entries[entry_id]["vector"] for entry_id in entry_ids])
+            similarities = matrix @ (vector / norm)
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                return None
+            entry = self._entries[entry_ids[best]]
+            entry["hits"] += 1
+            entry["last_hit_at"] = time.time()
+            self._entries.move_to_end(entry_ids[best])
+            self._hits += 1
+            return entry["answer"], entry["contexts"]
+
+    def store(self, query: str, embedding: List[float], answer: str, contexts: Optional[List[Dict]] = None):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm == 0 or not answer:
+            return
+        with self._lock:
+            self._expire(time.time())
+            while len(self._entries) >= self.max_entries:
+                self._entries.popitem(last=False)
+            self._entries[self._next_id] = {
+                "query": query,
+                "vector": vector / norm,
+                "answer": answer,
+                "contexts": list(contexts or []),
+                "created_at": time.time(),
+                "hits": 0,
+                "last_hit_at": None
+            }
+            self._next_id += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            now = time.time()
+            return {
+                "entries": len(self._entries),
+                "lookups": self._lookups,
+                "hits": self._hits,
+                "hit_rate": round(self._hits / self._lookups, 3) if self._lookups else 0.0,
+                "top_entries": [{
+                    "query": entry["query"],
+                    "hits": entry["hits"],
+                    "age_seconds": round(now - entry["created_at"]),
+                    "last_hit_seconds_ago": round(now - entry["last_hit_at"]) if entry["last_hit_at"] else None
+                } for entry in sorted(self._entries.values(), key=lambda entry: entry["hits"], reverse=True)[:20]]
+            }
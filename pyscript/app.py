@@ -1,11 +1,14 @@
 import sys
 import os
 import logging
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv
 import traceback
 import time
+import json
+import queue
+import threading
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)  # Set root logger to INFO level
@@ -17,19 +20,31 @@ logging.getLogger("hpack").setLevel(logging.WARNING)
 
 # Add the directory containing utils.py to the Python path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
-from pyscript.utils import init_connection, get_user_info, extract_file_content
+from pyscript.utils import init_connection, get_user_info
 import pandas as pd
 from unit_agent import PlanningAgent
 from chatbot import CourseRecommendationChatbot
+from llm_calls import LLMCaller
+from model_router import ModelRouter
+from singleflight import SingleFlight
+from resume_extraction import ResumeExtractor
+from plan_view import PlanViewCache, conditional_response
+from auth import TokenVerifier
 
 load_dotenv()
 app = Flask(__name__)
 # Update CORS configuration
 CORS(app, resources={r"/*": {"origins": os.environ.get('ALLOWED_ORIGIN', '*')}})
 
+# Shared deadline/retry/hedging wrapper for all Gemini calls in this worker
+llm_caller = LLMCaller()
+
+# Per-node model choice from rolling latency/error stats, shared by the planner and the chatbot
+model_router = ModelRouter()
+
 # Initialize the planner agent
 try:
-    planner = PlanningAgent()
+    planner = PlanningAgent(llm_caller=llm_caller, model_router=model_router)
 except Exception as e:
     app.logger.error(f"Error initializing PlanningAgent: {str(e)}")
     raise
@@ -41,9 +56,24 @@ except Exception as e:
     app.logger.error(f"Error initializing database connection: {str(e)}")
     raise
 
+# Resume text is extracted in the background at upload time and read back by plan generation
+resume_extractor = ResumeExtractor(_conn)
+
+# Aggregated dashboard payload per user, invalidated on every plan or task status write
+plan_views = PlanViewCache(_conn)
+# Checks that /plan callers are the user they ask about (the backend key bypasses RLS)
+token_verifier = TokenVerifier(_conn)
+
+# One plan generation per user at a time, across all workers on the host
+plan_flights = SingleFlight()
+
+# Subscribers and event history of the streamed plans running in this worker, by user
+_plan_streams = {}
+_plan_streams_lock = threading.Lock()
+
 # Initialize the chatbot
 try:
-    chatbot = CourseRecommendationChatbot()
+    chatbot = CourseRecommendationChatbot(llm_caller=llm_caller, model_router=model_router)
 except Exception as e:
     app.logger.error(f"Error initializing CourseRecommendationChatbot: {str(e)}")
     raise
@@ -58,45 +88,291 @@ def generate_plan():
         return jsonify({"error": "User ID is required"}), 400
 
     try:
-        start_time = time.time()
-        # Log the start of the process
-        app.logger.info(f"Starting plan generation for user {user_id}")
-        user_info = get_user_info(_conn, user_id)
+        # Double-clicks and client retries attach to the generation already running for this user
+        result, shared = plan_flights.do(user_id, create_plan, user_id, request.json.get('plan_run_id'))
+        if shared:
+            app.logger.info(f"Attached to in-flight plan generation for {user_id}")
+        return jsonify(result), 200
+
+    except Exception as e:
+        app.logger.error(f"Error in generate_plan: {str(e)}")
+        return jsonify({"error": str(e)}), 500
 
-        # Log after fetching user info
-        app.logger.info(f"Fetched user info for {user_id} in {time.time() - start_time:.2f} seconds")
+def create_plan(user_id, plan_run_id):
+    start_time = time.time()
+    # Log the start of the process
+    app.logger.info(f"Starting plan generation for user {user_id}")
+    user_info = get_user_info(_conn, user_id)
 
-        resume_content = extract_file_content(user_info['resume'])
-        
-        # Log after extracting resume content
-        app.logger.info(f"Extracted resume content for {user_id} in {time.time() - start_time:.2f} seconds")
+    # Log after fetching user info
+    app.logger.info(f"Fetched user info for {user_id} in {time.time() - start_time:.2f} seconds")
 
-        themes_df, tasks_df = planner.generate_plan(user_info, resume_content)
+    resume_content = resume_extractor.get_text(user_info['resume'])
+    
+    # Log after extracting resume content
+    app.logger.info(f"Loaded resume content for {user_id} in {time.time() - start_time:.2f} seconds")
+
+    # Retries with the same profile resume from the last checkpointed month
+    themes_df, tasks_df = planner.generate_plan(user_info, resume_content, plan_run_id=plan_run_id)
+
+    # Log after generating plan
+    app.logger.info(f"Generated plan for {user_id} in {time.time() - start_time:.2f} seconds")
+
+    # Replaces any stored plan, so a repeated request does not add a second copy
+    store_theme(user_id, themes_df.to_dict('records')[0])
+    replace_tasks(user_id, tasks_df)
+    plan_views.invalidate(user_id)
+    
+    # Log completion
+    app.logger.info(f"Completed plan generation and storage for {user_id} in {time.time() - start_time:.2f} seconds")
+
+    return {"message": "Plan generated and stored successfully"}
+
+@app.route('/generate_plan/stream', methods=['GET'])
+def generate_plan_stream():
+    user_id = request.args.get('user_id')
+    if not user_id:
+        return jsonify({"error": "User ID is required"}), 400
 
-        # Log after generating plan
-        app.logger.info(f"Generated plan for {user_id} in {time.time() - start_time:.2f} seconds")
+    # Generation and storage run in their own thread, so a client that disconnects
+    # mid-stream does not stop the plan from being completed and stored. A second
+    # stream for the same user replays the months sent so far and follows the first.
+    events = queue.Queue()
+    with _plan_streams_lock:
+        stream = _plan_streams.get(user_id)
+        if stream is None:
+            _plan_streams[user_id] = {"subscribers": [events], "history": []}
+        else:
+            stream["subscribers"].append(events)
+            for event in stream["history"]:
+                events.put(event)
+    if stream is None:
+        threading.Thread(
+            target=run_streamed_plan,
+            args=(user_id, request.args.get('plan_run_id')),
+            daemon=True
+        ).start()
 
-        themes_data = themes_df.to_dict('records')[0]
-        themes_data['user_id'] = user_id
-        _conn.table('user_plan_theme').insert(themes_data).execute()
+    def event_stream():
+        while True:
+            try:
+                event, data = events.get(timeout=15)
+            except queue.Empty:
+                # Keep proxies from closing an idle connection between months
+                yield ": keep-alive\n\n"
+                continue
+            yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+            if event in ('done', 'error'):
+                break
 
-        tasks_data = tasks_df.to_dict('records')
-        for task in tasks_data:
-            task['user_id'] = user_id
-            task['status'] = 0
-            # Ensure task_number is float when inserting
-            task['task_number'] = float(task['task_number'])
-            _conn.table('user_plan_taskoutline').insert(task).execute()
-        
-        # Log completion
-        app.logger.info(f"Completed plan generation and storage for {user_id} in {time.time() - start_time:.2f} seconds")
+    return Response(stream_with_context(event_stream()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
-        return jsonify({"message": "Plan generated and stored successfully"}), 200
+def publish_plan_event(user_id, event, data):
+    with _plan_streams_lock:
+        stream = _plan_streams.get(user_id)
+        if stream is None:
+            return
+        stream["history"].append((event, data))
+        for subscriber in stream["subscribers"]:
+            subscriber.put((event, data))
+        if event in ('done', 'error'):
+            del _plan_streams[user_id]
 
+def run_streamed_plan(user_id, plan_run_id):
+    try:
+        result, shared = plan_flights.do(user_id, create_streamed_plan, user_id, plan_run_id)
+        if shared:
+            app.logger.info(f"Streamed plan request for {user_id} attached to an in-flight generation")
+        publish_plan_event(user_id, "done", result)
     except Exception as e:
-        app.logger.error(f"Error in generate_plan: {str(e)}")
+        app.logger.error(f"Error in generate_plan_stream: {str(e)}")
+        publish_plan_event(user_id, "error", {"error": str(e)})
+
+def create_streamed_plan(user_id, plan_run_id):
+    start_time = time.time()
+    app.logger.info(f"Starting streamed plan generation for user {user_id}")
+    user_info = get_user_info(_conn, user_id)
+    resume_content = resume_extractor.get_text(user_info['resume'])
+
+    def on_month(month_num, month_plan):
+        store_month(user_id, month_num, month_plan)
+        publish_plan_event(user_id, "month", {
+            "month": month_num,
+            "theme": month_plan['theme'],
+            "tasks": [{"task_number": task['number'], "task_outline": task['content']} for task in month_plan['tasks']]
+        })
+        app.logger.info(f"Stored month {month_num} for {user_id} in {time.time() - start_time:.2f} seconds")
+
+    _, tasks_df = planner.generate_plan(user_info, resume_content, plan_run_id=plan_run_id, on_month=on_month)
+    store_course_links(user_id, tasks_df)
+
+    app.logger.info(f"Completed streamed plan generation for {user_id} in {time.time() - start_time:.2f} seconds")
+    return {"message": "Plan generated and stored successfully"}
+
+def store_month(user_id, month_num, month_plan):
+    # Idempotent per month: a resumed run re-delivers months that may already be stored
+    store_theme(user_id, {f"month_{month_num}": month_plan['theme']})
+
+    _conn.table('user_plan_taskoutline').delete().eq('user_id', user_id).eq('month', month_num).execute()
+    tasks_data = [{
+        'user_id': user_id,
+        'month': month_num,
+        'task_number': float(task['number']),
+        'task_outline': task['content'],
+        'status': 0
+    } for task in month_plan['tasks']]
+    if tasks_data:
+        _conn.table('user_plan_taskoutline').insert(tasks_data).execute()
+    plan_views.invalidate(user_id)
+
+def store_course_links(user_id, tasks_df):
+    # Streamed months are stored before the plan is complete; their course links come after
+    if 'course_links' not in tasks_df:
+        return
+    links = {(int(task['month']), float(task['task_number'])): task['course_links'] for task in tasks_df.to_dict('records')}
+    rows = _conn.table('user_plan_taskoutline').select('id,month,task_number').eq('user_id', user_id).execute().data
+    # Only course_links is written, so a status change made meanwhile is kept
+    for row in rows:
+        task_links = links.get((int(row['month']), float(row['task_number'])))
+        if task_links:
+            _conn.table('user_plan_taskoutline').update({'course_links': task_links}).eq('id', row['id']).execute()
+    plan_views.invalidate(user_id)
+
+@app.route('/replan', methods=['POST', 'OPTIONS'])
+def replan():
+    if request.method == 'OPTIONS':
+        return '', 204
+
+    user_id = request.json.get('user_id')
+    if not user_id:
+        return jsonify({"error": "User ID is required"}), 400
+    try:
+        start_month = int(request.json.get('start_month'))
+    except (TypeError, ValueError):
+        return jsonify({"error": "start_month must be a month number between 1 and 12"}), 400
+    if not 1 <= start_month <= 12:
+        return jsonify({"error": "start_month must be a month number between 1 and 12"}), 400
+
+    try:
+        # Serialized with /generate_plan and the plan stream for the same user, so their
+        # inserts and deletes never interleave; a repeated re-plan attaches to the running one
+        result, shared = plan_flights.do(user_id, create_replan, user_id, start_month, request.json.get('plan_run_id'))
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 404
+    except Exception as e:
+        app.logger.error(f"Error in replan: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+    if shared and result.get('start_month') != start_month:
+        return jsonify({"error": "Another plan update for this user was in progress. Please try again."}), 409
+    return jsonify(result), 200
+
+def create_replan(user_id, start_month, plan_run_id):
+    start_time = time.time()
+    app.logger.info(f"Starting re-plan of months {start_month}-12 for user {user_id}")
+
+    themes_rows = _conn.table('user_plan_theme').select('*').eq('user_id', user_id).execute().data
+    if not themes_rows:
+        raise LookupError("No existing plan found. Use /generate_plan first.")
+    kept_tasks = _conn.table('user_plan_taskoutline').select('*').eq('user_id', user_id).lt('month', start_month).execute().data
+
+    user_info = get_user_info(_conn, user_id)
+    resume_content = resume_extractor.get_text(user_info['resume'])
+
+    themes_df, tasks_df = planner.replan(user_info, resume_content, themes_rows[0], kept_tasks, start_month,
+                                         plan_run_id=plan_run_id)
+    if tasks_df.empty:
+        raise ValueError("Re-planning did not produce any months")
+
+    app.logger.info(f"Re-planned months {start_month}-12 for {user_id} in {time.time() - start_time:.2f} seconds")
+
+    # Rewrite only the re-planned months; earlier months and their task status stay untouched
+    # New tasks are stored before the old months are deleted, so a failed insert leaves the previous plan in place
+    replace_tasks(user_id, tasks_df, start_month)
+    _conn.table('user_plan_theme').update(themes_df.to_dict('records')[0]).eq('user_id', user_id).execute()
+    plan_views.invalidate(user_id)
+
+    app.logger.info(f"Completed re-plan and storage for {user_id} in {time.time() - start_time:.2f} seconds")
+
+    return {"message": f"Months {start_month}-12 re-planned and stored successfully", "start_month": start_month}
+
+def store_theme(user_id, themes):
+    # One theme row per user, updated in place
+    if _conn.table('user_plan_theme').select('user_id').eq('user_id', user_id).execute().data:
+        _conn.table('user_plan_theme').update(themes).eq('user_id', user_id).execute()
+    else:
+        _conn.table('user_plan_theme').insert(dict(themes, user_id=user_id)).execute()
+
+def replace_tasks(user_id, tasks_df, start_month=1):
+    # The new rows go in before the old ones are removed, so a failed write never leaves the user without tasks
+    new_ids = [row['id'] for row in store_tasks(user_id, tasks_df)]
+    stale = _conn.table('user_plan_taskoutline').delete().eq('user_id', user_id).gte('month', start_month)
+    if new_ids:
+        stale = stale.not_.in_('id', new_ids)
+    stale.execute()
+
+def store_tasks(user_id, tasks_df):
+    tasks_data = tasks_df.to_dict('records')
+    for task in tasks_data:
+        task['user_id'] = user_id
+        task['status'] = 0
+        # Ensure task_number is float when inserting
+        task['task_number'] = float(task['task_number'])
+    return _conn.table('user_plan_taskoutline').insert(tasks_data).execute().data
+
+@app.route('/plan/<user_id>', methods=['GET'])
+def get_plan(user_id):
+    denied = token_verifier.authorize(request.headers.get('Authorization'), user_id)
+    if denied:
+        return jsonify({"error": denied[0]}), denied[1]
+    try:
+        view = plan_views.get(user_id)
+    except Exception as e:
+        app.logger.error(f"Error loading plan for {user_id}: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+    if view is None:
+        return jsonify({"error": "No plan found"}), 404
+
+    status, body, headers = conditional_response(view, request.headers.get('If-None-Match'),
+                                                 request.headers.get('Accept-Encoding'))
+    return Response(body, status=status, headers=headers)
+
+@app.route('/plan/<user_id>/tasks/<task_id>/status', methods=['POST', 'OPTIONS'])
+def update_task_status(user_id, task_id):
+    if request.method == 'OPTIONS':
+        return '', 204
+    denied = token_verifier.authorize(request.headers.get('Authorization'), user_id)
+    if denied:
+        return jsonify({"error": denied[0]}), denied[1]
+
+    status = request.json.get('status')
+    if status not in (0, 1, 2):
+        return jsonify({"error": "status must be 0 (not started), 1 (in progress) or 2 (completed)"}), 400
+
+    try:
+        updated = _conn.table('user_plan_taskoutline').update({'status': status}).eq('id', task_id).eq('user_id', user_id).execute().data
+        plan_views.invalidate(user_id)
+    except Exception as e:
+        app.logger.error(f"Error updating task {task_id} for {user_id}: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+    if not updated:
+        return jsonify({"error": "Task not found"}), 404
+    return jsonify({"message": "Task status updated"}), 200
+
+@app.route('/resume/extract', methods=['POST', 'OPTIONS'])
+def extract_resume():
+    if request.method == 'OPTIONS':
+        return '', 204
+
+    resume_url = request.json.get('resume_url')
+    if not resume_url:
+        return jsonify({"error": "resume_url is required"}), 400
+
+    # Runs in the background; the client does not wait for the extraction
+    resume_extractor.submit(resume_url)
+    return jsonify({"message": "Resume extraction started"}), 202
+
 @app.route('/api/chat', methods=['POST', 'OPTIONS'])
 def chat():
     if request.method == 'OPTIONS':
@@ -104,20 +380,42 @@ def chat():
     data = request.json
     query = data.get('message')
     conversation_history = data.get('conversation_history', [])
+    session_id = data.get('session_id')
     
     if not query:
         return jsonify({"error": "No message provided"}), 400
 
     try:
-        response = chatbot.get_answer(query, conversation_history)
+        response = chatbot.get_answer(query, conversation_history, session_id)
         return jsonify({"response": response})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/llm_stats', methods=['GET'])
+def llm_stats():
+    return jsonify(llm_caller.stats())
+
+@app.route('/model_stats', methods=['GET'])
+def model_stats():
+    return jsonify(model_router.stats())
+
+@app.route('/chat_cache_stats', methods=['GET'])
+def chat_cache_stats():
+    return jsonify(dict(chatbot.answer_cache.stats(), sessions=chatbot.retrieval_contexts.stats()))
+
+@app.route('/embedding_stats', methods=['GET'])
+def embedding_stats():
+    return jsonify(chatbot.embedding_batcher.stats())
+
+@app.route('/plan_cache_stats', methods=['GET'])
+def plan_cache_stats():
+    return jsonify(plan_views.stats())
+
 @app.after_request
 def after_request(response):
     response.headers.add('Access-Control-Allow-Origin', os.environ.get('ALLOWED_ORIGIN', '*'))
-    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
+    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization,If-None-Match')
+    response.headers.add('Access-Control-Expose-Headers', 'ETag')
     response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
     return response
 
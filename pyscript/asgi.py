@@ -0,0 +1,419 @@
+import sys
+import os
+import logging
+import asyncio
+import time
+import json
+from quart import Quart, Response, request, jsonify
+from quart_cors import cors
+from dotenv import load_dotenv
+
+# Async serving mode: the same API as app.py, but each request is a coroutine instead of a
+# worker thread, so one process keeps hundreds of LLM-bound requests in flight. Run with:
+#
+#   uvicorn --app-dir pyscript asgi:app --host 0.0.0.0 --port 5000
+
+logging.basicConfig(level=logging.INFO)
+
+logging.getLogger("httpcore").setLevel(logging.WARNING)
+logging.getLogger("httpx").setLevel(logging.WARNING)
+logging.getLogger("hpack").setLevel(logging.WARNING)
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from pyscript.utils import init_connection, ainit_connection, aget_user_info
+from unit_agent import PlanningAgent
+from chatbot import CourseRecommendationChatbot
+from llm_calls import LLMCaller
+from model_router import ModelRouter
+from singleflight import SingleFlight
+from resume_extraction import ResumeExtractor
+from plan_view import PlanViewCache, conditional_response
+from auth import TokenVerifier
+
+load_dotenv()
+app = Quart(__name__)
+app = cors(app, allow_origin=os.environ.get('ALLOWED_ORIGIN', '*'))
+
+# Shared deadline/retry/hedging wrapper for all Gemini calls in this process
+llm_caller = LLMCaller()
+
+# Per-node model choice from rolling latency/error stats, shared by the planner and the chatbot
+model_router = ModelRouter()
+
+try:
+    planner = PlanningAgent(llm_caller=llm_caller, model_router=model_router)
+except Exception as e:
+    app.logger.error(f"Error initializing PlanningAgent: {str(e)}")
+    raise
+
+try:
+    chatbot = CourseRecommendationChatbot(llm_caller=llm_caller, model_router=model_router)
+except Exception as e:
+    app.logger.error(f"Error initializing CourseRecommendationChatbot: {str(e)}")
+    raise
+
+# One plan generation per user at a time, shared with the Flask workers on the host
+plan_flights = SingleFlight()
+
+# Subscribers and event history of the streamed plans running in this process, by user
+_plan_streams = {}
+# Streamed plans run as tasks of their own; the loop only keeps weak references to tasks
+_plan_tasks = set()
+
+# Resume extraction and the plan view cache run on threads with a sync Supabase client
+try:
+    _sync_conn = init_connection()
+except Exception as e:
+    app.logger.error(f"Error initializing database connection: {str(e)}")
+    raise
+resume_extractor = ResumeExtractor(_sync_conn)
+plan_views = PlanViewCache(_sync_conn)
+# Checks that /plan callers are the user they ask about (the backend key bypasses RLS)
+token_verifier = TokenVerifier(_sync_conn)
+
+# Async Supabase client, created on the serving event loop
+_conn = None
+
+@app.before_serving
+async def startup():
+    global _conn
+    try:
+        _conn = await ainit_connection()
+        await planner.asetup()
+        await chatbot.asetup()
+    except Exception as e:
+        app.logger.error(f"Error initializing async clients: {str(e)}")
+        raise
+
+@app.route('/generate_plan', methods=['POST'])
+async def generate_plan():
+    data = await request.get_json()
+    user_id = data.get('user_id')
+    if not user_id:
+        return jsonify({"error": "User ID is required"}), 400
+
+    try:
+        result, shared = await plan_flights.ado(user_id, create_plan, user_id, data.get('plan_run_id'))
+        if shared:
+            app.logger.info(f"Attached to in-flight plan generation for {user_id}")
+        return jsonify(result), 200
+
+    except Exception as e:
+        app.logger.error(f"Error in generate_plan: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+async def create_plan(user_id, plan_run_id):
+    start_time = time.time()
+    app.logger.info(f"Starting plan generation for user {user_id}")
+    user_info = await aget_user_info(_conn, user_id)
+    app.logger.info(f"Fetched user info for {user_id} in {time.time() - start_time:.2f} seconds")
+
+    # Usually precomputed at upload time; otherwise parsing (PDF/OCR) runs off the event loop
+    resume_content = await asyncio.to_thread(resume_extractor.get_text, user_info['resume'])
+    app.logger.info(f"Loaded resume content for {user_id} in {time.time() - start_time:.2f} seconds")
+
+    themes_df, tasks_df = await planner.agenerate_plan(user_info, resume_content, plan_run_id=plan_run_id)
+    app.logger.info(f"Generated plan for {user_id} in {time.time() - start_time:.2f} seconds")
+
+    # Replaces any stored plan, so a repeated request does not add a second copy
+    await store_theme(user_id, themes_df.to_dict('records')[0])
+    await replace_tasks(user_id, tasks_df)
+    await asyncio.to_thread(plan_views.invalidate, user_id)
+
+    app.logger.info(f"Completed plan generation and storage for {user_id} in {time.time() - start_time:.2f} seconds")
+
+    return {"message": "Plan generated and stored successfully"}
+
+@app.route('/generate_plan/stream', methods=['GET'])
+async def generate_plan_stream():
+    user_id = request.args.get('user_id')
+    if not user_id:
+        return jsonify({"error": "User ID is required"}), 400
+
+    # Generation and storage run in their own task, so a client that disconnects
+    # mid-stream does not stop the plan from being completed and stored. A second
+    # stream for the same user replays the months sent so far and follows the first.
+    events = asyncio.Queue()
+    stream = _plan_streams.get(user_id)
+    if stream is None:
+        _plan_streams[user_id] = {"subscribers": [events], "history": []}
+        task = asyncio.create_task(run_streamed_plan(user_id, request.args.get('plan_run_id')))
+        _plan_tasks.add(task)
+        task.add_done_callback(_plan_tasks.discard)
+    else:
+        stream["subscribers"].append(events)
+        for event in stream["history"]:
+            events.put_nowait(event)
+
+    async def event_stream():
+        while True:
+            try:
+                event, data = await asyncio.wait_for(events.get(), timeout=15)
+            except asyncio.TimeoutError:
+                # Keep proxies from closing an idle connection between months
+                yield b": keep-alive\n\n"
+                continue
+            yield f"event: {event}\ndata: {json.dumps(data)}\n\n".encode('utf-8')
+            if event in ('done', 'error'):
+                break
+
+    response = Response(event_stream(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # A full plan takes minutes, longer than Quart's default response timeout
+    response.timeout = None
+    return response
+
+def publish_plan_event(user_id, event, data):
+    stream = _plan_streams.get(user_id)
+    if stream is None:
+        return
+    stream["history"].append((event, data))
+    for subscriber in stream["subscribers"]:
+        subscriber.put_nowait((event, data))
+    if event in ('done', 'error'):
+        del _plan_streams[user_id]
+
+async def run_streamed_plan(user_id, plan_run_id):
+    try:
+        result, shared = await plan_flights.ado(user_id, create_streamed_plan, user_id, plan_run_id)
+        if shared:
+            app.logger.info(f"Streamed plan request for {user_id} attached to an in-flight generation")
+        publish_plan_event(user_id, "done", result)
+    except Exception as e:
+        app.logger.error(f"Error in generate_plan_stream: {str(e)}")
+        publish_plan_event(user_id, "error", {"error": str(e)})
+
+async def create_streamed_plan(user_id, plan_run_id):
+    start_time = time.time()
+    app.logger.info(f"Starting streamed plan generation for user {user_id}")
+    user_info = await aget_user_info(_conn, user_id)
+    resume_content = await asyncio.to_thread(resume_extractor.get_text, user_info['resume'])
+
+    # on_month is called synchronously between graph steps, so the months are handed to
+    # a single writer task that stores and publishes them in order
+    months = asyncio.Queue()
+
+    async def store_months():
+        while True:
+            item = await months.get()
+            if item is None:
+                return
+            month_num, month_plan = item
+            await store_month(user_id, month_num, month_plan)
+            publish_plan_event(user_id, "month", {
+                "month": month_num,
+                "theme": month_plan['theme'],
+                "tasks": [{"task_number": task['number'], "task_outline": task['content']} for task in month_plan['tasks']]
+            })
+            app.logger.info(f"Stored month {month_num} for {user_id} in {time.time() - start_time:.2f} seconds")
+
+    writer = asyncio.create_task(store_months())
+
+    def on_month(month_num, month_plan):
+        # A failed write stops the generation, as it does in app.py
+        if writer.done():
+            writer.result()
+        months.put_nowait((month_num, month_plan))
+
+    try:
+        _, tasks_df = await planner.agenerate_plan(user_info, resume_content, plan_run_id=plan_run_id, on_month=on_month)
+    finally:
+        months.put_nowait(None)
+        await writer
+    await store_course_links(user_id, tasks_df)
+
+    app.logger.info(f"Completed streamed plan generation for {user_id} in {time.time() - start_time:.2f} seconds")
+    return {"message": "Plan generated and stored successfully"}
+
+async def store_month(user_id, month_num, month_plan):
+    # Idempotent per month: a resumed run re-delivers months that may already be stored
+    await store_theme(user_id, {f"month_{month_num}": month_plan['theme']})
+
+    await _conn.table('user_plan_taskoutline').delete().eq('user_id', user_id).eq('month', month_num).execute()
+    tasks_data = [{
+        'user_id': user_id,
+        'month': month_num,
+        'task_number': float(task['number']),
+        'task_outline': task['content'],
+        'status': 0
+    } for task in month_plan['tasks']]
+    if tasks_data:
+        await _conn.table('user_plan_taskoutline').insert(tasks_data).execute()
+    await asyncio.to_thread(plan_views.invalidate, user_id)
+
+async def store_course_links(user_id, tasks_df):
+    # Streamed months are stored before the plan is complete; their course links come after
+    if 'course_links' not in tasks_df:
+        return
+    links = {(int(task['month']), float(task['task_number'])): task['course_links'] for task in tasks_df.to_dict('records')}
+    rows = (await _conn.table('user_plan_taskoutline').select('id,month,task_number').eq('user_id', user_id).execute()).data
+    # Only course_links is written, so a status change made meanwhile is kept
+    for row in rows:
+        task_links = links.get((int(row['month']), float(row['task_number'])))
+        if task_links:
+            await _conn.table('user_plan_taskoutline').update({'course_links': task_links}).eq('id', row['id']).execute()
+    await asyncio.to_thread(plan_views.invalidate, user_id)
+
+@app.route('/replan', methods=['POST'])
+async def replan():
+    data = await request.get_json()
+    user_id = data.get('user_id')
+    if not user_id:
+        return jsonify({"error": "User ID is required"}), 400
+    try:
+        start_month = int(data.get('start_month'))
+    except (TypeError, ValueError):
+        return jsonify({"error": "start_month must be a month number between 1 and 12"}), 400
+    if not 1 <= start_month <= 12:
+        return jsonify({"error": "start_month must be a month number between 1 and 12"}), 400
+
+    try:
+        # Serialized with /generate_plan and the plan stream for the same user, so their
+        # inserts and deletes never interleave; a repeated re-plan attaches to the running one
+        result, shared = await plan_flights.ado(user_id, create_replan, user_id, start_month, data.get('plan_run_id'))
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 404
+    except Exception as e:
+        app.logger.error(f"Error in replan: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+    if shared and result.get('start_month') != start_month:
+        return jsonify({"error": "Another plan update for this user was in progress. Please try again."}), 409
+    return jsonify(result), 200
+
+async def create_replan(user_id, start_month, plan_run_id):
+    start_time = time.time()
+    app.logger.info(f"Starting re-plan of months {start_month}-12 for user {user_id}")
+
+    themes_rows = (await _conn.table('user_plan_theme').select('*').eq('user_id', user_id).execute()).data
+    if not themes_rows:
+        raise LookupError("No existing plan found. Use /generate_plan first.")
+    kept_tasks = (await _conn.table('user_plan_taskoutline').select('*').eq('user_id', user_id).lt('month', start_month).execute()).data
+
+    user_info = await aget_user_info(_conn, user_id)
+    resume_content = await asyncio.to_thread(resume_extractor.get_text, user_info['resume'])
+
+    themes_df, tasks_df = await planner.areplan(user_info, resume_content, themes_rows[0], kept_tasks, start_month,
+                                                plan_run_id=plan_run_id)
+    if tasks_df.empty:
+        raise ValueError("Re-planning did not produce any months")
+
+    app.logger.info(f"Re-planned months {start_month}-12 for {user_id} in {time.time() - start_time:.2f} seconds")
+
+    # Rewrite only the re-planned months; earlier months and their task status stay untouched
+    await replace_tasks(user_id, tasks_df, start_month)
+    await _conn.table('user_plan_theme').update(themes_df.to_dict('records')[0]).eq('user_id', user_id).execute()
+    await asyncio.to_thread(plan_views.invalidate, user_id)
+
+    app.logger.info(f"Completed re-plan and storage for {user_id} in {time.time() - start_time:.2f} seconds")
+
+    return {"message": f"Months {start_month}-12 re-planned and stored successfully", "start_month": start_month}
+
+async def store_theme(user_id, themes):
+    if (await _conn.table('user_plan_theme').select('user_id').eq('user_id', user_id).execute()).data:
+        await _conn.table('user_plan_theme').update(themes).eq('user_id', user_id).execute()
+    else:
+        await _conn.table('user_plan_theme').insert(dict(themes, user_id=user_id)).execute()
+
+async def replace_tasks(user_id, tasks_df, start_month=1):
+    # The new rows go in before the old ones are removed, so a failed write never leaves the user without tasks
+    new_ids = [row['id'] for row in await store_tasks(user_id, tasks_df)]
+    stale = _conn.table('user_plan_taskoutline').delete().eq('user_id', user_id).gte('month', start_month)
+    if new_ids:
+        stale = stale.not_.in_('id', new_ids)
+    await stale.execute()
+
+async def store_tasks(user_id, tasks_df):
+    tasks_data = tasks_df.to_dict('records')
+    for task in tasks_data:
+        task['user_id'] = user_id
+        task['status'] = 0
+        task['task_number'] = float(task['task_number'])
+    return (await _conn.table('user_plan_taskoutline').insert(tasks_data).execute()).data
+
+@app.route('/plan/<user_id>', methods=['GET'])
+async def get_plan(user_id):
+    denied = await asyncio.to_thread(token_verifier.authorize, request.headers.get('Authorization'), user_id)
+    if denied:
+        return jsonify({"error": denied[0]}), denied[1]
+    try:
+        view = await asyncio.to_thread(plan_views.get, user_id)
+    except Exception as e:
+        app.logger.error(f"Error loading plan for {user_id}: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+    if view is None:
+        return jsonify({"error": "No plan found"}), 404
+
+    status, body, headers = conditional_response(view, request.headers.get('If-None-Match'),
+                                                 request.headers.get('Accept-Encoding'))
+    return Response(body, status=status, headers=headers)
+
+@app.route('/plan/<user_id>/tasks/<task_id>/status', methods=['POST'])
+async def update_task_status(user_id, task_id):
+    denied = await asyncio.to_thread(token_verifier.authorize, request.headers.get('Authorization'), user_id)
+    if denied:
+        return jsonify({"error": denied[0]}), denied[1]
+    data = await request.get_json()
+    status = data.get('status')
+    if status not in (0, 1, 2):
+        return jsonify({"error": "status must be 0 (not started), 1 (in progress) or 2 (completed)"}), 400
+
+    try:
+        updated = (await _conn.table('user_plan_taskoutline').update({'status': status}).eq('id', task_id).eq('user_id', user_id).execute()).data
+        await asyncio.to_thread(plan_views.invalidate, user_id)
+    except Exception as e:
+        app.logger.error(f"Error updating task {task_id} for {user_id}: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+    if not updated:
+        return jsonify({"error": "Task not found"}), 404
+    return jsonify({"message": "Task status updated"}), 200
+
+@app.route('/resume/extract', methods=['POST'])
+async def extract_resume():
+    data = await request.get_json()
+    resume_url = data.get('resume_url')
+    if not resume_url:
+        return jsonify({"error": "resume_url is required"}), 400
+
+    resume_extractor.submit(resume_url)
+    return jsonify({"message": "Resume extraction started"}), 202
+
+@app.route('/api/chat', methods=['POST'])
+async def chat():
+    data = await request.get_json()
+    query = data.get('message')
+    conversation_history = data.get('conversation_history', [])
+    session_id = data.get('session_id')
+
+    if not query:
+        return jsonify({"error": "No message provided"}), 400
+
+    try:
+        response = await chatbot.aget_answer(query, conversation_history, session_id)
+        return jsonify({"response": response})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/llm_stats', methods=['GET'])
+async def llm_stats():
+    return jsonify(llm_caller.stats())
+
+@app.route('/model_stats', methods=['GET'])
+async def model_stats():
+    return jsonify(model_router.stats())
+
+@app.route('/chat_cache_stats', methods=['GET'])
+async def chat_cache_stats():
+    return jsonify(dict(chatbot.answer_cache.stats(), sessions=chatbot.retrieval_contexts.stats()))
+
+@app.route('/embedding_stats', methods=['GET'])
+async def embedding_stats():
+    return jsonify(chatbot.embedding_batcher.stats())
+
+@app.route('/plan_cache_stats', methods=['GET'])
+async def plan_cache_stats():
+    return jsonify(plan_views.stats())
+
+if __name__ == '__main__':
+    port = int(os.environ.get('PORT', 5000))
+    app.run(host='0.0.0.0', port=port, debug=False)
@@ -0,0 +1,77 @@
+import os
+import json
+import time
+import base64
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+
+class TokenVerifier:
+    """Resolves the Supabase access token sent by the dashboard (Authorization: Bearer ...)
+    to the id of the signed-in user.
+
+    The backend client uses the service key, which bypasses row level security, so
+    per-user endpoints must check that the caller is the user they ask about. Tokens are
+    verified with Supabase Auth and remembered until they expire, at most AUTH_CACHE_TTL
+    seconds, so a dashboard session costs one verification rather than one per request."""
+
+    def __init__(self, conn, ttl_seconds: Optional[float] = None, max_entries: int = 10000):
+        self.conn = conn
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.getenv("AUTH_CACHE_TTL", 300))
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._verified = OrderedDict()
+
+    @staticmethod
+    def bearer_token(authorization: Optional[str]) -> Optional[str]:
+        scheme, _, token = (authorization or "").partition(" ")
+        return token.strip() if scheme.lower() == "bearer" and token.strip() else None
+
+    @staticmethod
+    def _expires_at(token: str) -> Optional[float]:
+        # Only read after Supabase has accepted the token, so the claims can be trusted
+        try:
+            payload = token.split(".")[1]
+            claims = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+            return float(claims["exp"])
+        except (IndexError, KeyError, TypeError, ValueError):
+            return None
+
+    def user_id(self, authorization: Optional[str]) -> Optional[str]:
+        # None when the header is missing or the token is invalid or expired
+        token = self.bearer_token(authorization)
+        if token is None:
+            return None
+        key = hashlib.sha256(token.encode("utf-8")).hexdigest()
+        now = time.time()
+        with self._lock:
+            entry = self._verified.get(key)
+            if entry is not None and entry[1] > now:
+                return entry[0]
+
+        try:
+            user = self.conn.auth.get_user(token).user
+        except Exception as e:
+            print(f"Rejected access token: {e}")
+            return None
+        if user is None:
+            return None
+
+        expires_at = min(self._expires_at(token) or now, now + self.ttl_seconds)
+        with self._lock:
+            self._verified[key] = (user.id, expires_at)
+            self._verified.move_to_end(key)
+            while len(self._verified) > self.max_entries:
+                self._verified.popitem(last=False)
+        return user.id
+
+    def authorize(self, authorization: Optional[str], user_id: str) -> Optional[tuple]:
+        # None when the caller may act for user_id, otherwise (error message, HTTP status)
+        caller = self.user_id(authorization)
+        if caller is None:
+            return "Missing or invalid access token", 401
+        if caller != user_id:
+            return "Not allowed to access another user's plan", 403
+        return None
@@ -0,0 +1,189 @@
+import os
+import json
+import time
+import argparse
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dotenv import load_dotenv
+from utils import init_connection, get_users_info, select_column
+from resume_extraction import ResumeExtractor
+from plan_view import PlanViewCache
+from unit_agent import PlanningAgent
+from llm_calls import LLMCaller
+from rate_limiter import RateGovernor
+
+# Bulk plan generation for backfills, e.g. regenerating every user's plan after a prompt change.
+#
+#   python batch_generate.py --user-ids ids.txt --workers 4
+#   python batch_generate.py --query missing-plan --progress backfill.jsonl
+#
+# Progress is appended to a JSONL file after every bulk write; running the same command
+# again skips users already written and resumes half-finished plans from their checkpoints.
+
+
+def read_user_ids(_conn, user_ids_file=None, query=None):
+    if user_ids_file:
+        with open(user_ids_file) as f:
+            return [line.strip() for line in f if line.strip()]
+
+    user_ids = select_column(_conn, 'user_info', 'user_id')
+    if query == 'missing-plan':
+        with_plan = set(select_column(_conn, 'user_plan_theme', 'user_id'))
+        user_ids = [user_id for user_id in user_ids if user_id not in with_plan]
+    return user_ids
+
+
+def load_progress(progress_path):
+    run_name = None
+    done = set()
+    failed = set()
+    if os.path.exists(progress_path):
+        with open(progress_path) as f:
+            for line in f:
+                record = json.loads(line)
+                if 'run_name' in record:
+                    run_name = record['run_name']
+                elif record['status'] == 'done':
+                    done.add(record['user_id'])
+                    failed.discard(record['user_id'])
+                else:
+                    failed.add(record['user_id'])
+    return run_name, done, failed
+
+
+def append_progress(progress_path, records):
+    with open(progress_path, 'a') as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+
+
+def generate_user_plan(planner, extractor, user_info, run_name):
+    resume_content = extractor.get_text(user_info.get('resume'))
+    # A run-specific id so a backfill never reuses a plan checkpointed before the prompt change,
+    # while a restarted backfill still resumes its own half-finished plans
+    themes_df, tasks_df = planner.generate_plan(user_info, resume_content, plan_run_id=run_name)
+    if tasks_df.empty:
+        raise ValueError("No plan was generated")
+    return themes_df.to_dict('records')[0], tasks_df.to_dict('records')
+
+
+def write_results(_conn, plan_views, results):
+    user_ids = [user_id for user_id, _, _ in results]
+    task_rows = []
+    for user_id, _, tasks in results:
+        for task in tasks:
+            task_rows.append(dict(task, user_id=user_id, status=0, task_number=float(task['task_number'])))
+
+    # New task rows go in (one bulk insert) before the users' old rows are deleted, so a
+    # failed write never leaves a user without a plan
+    new_ids = {}
+    for row in _conn.table('user_plan_taskoutline').insert(task_rows).execute().data:
+        new_ids.setdefault(row['user_id'], []).append(row['id'])
+    for user_id in user_ids:
+        stale = _conn.table('user_plan_taskoutline').delete().eq('user_id', user_id)
+        if new_ids.get(user_id):
+            stale = stale.not_.in_('id', new_ids[user_id])
+        stale.execute()
+
+    # One theme row per user: existing rows are updated in place, the rest inserted together
+    existing = {row['user_id'] for row in _conn.table('user_plan_theme').select('user_id').in_('user_id', user_ids).execute().data}
+    for user_id, themes, _ in results:
+        if user_id in existing:
+            _conn.table('user_plan_theme').update(themes).eq('user_id', user_id).execute()
+    new_themes = [dict(themes, user_id=user_id) for user_id, themes, _ in results if user_id not in existing]
+    if new_themes:
+        _conn.table('user_plan_theme').insert(new_themes).execute()
+
+    # Dashboards served from this host pick up the new plans on their next load
+    for user_id in user_ids:
+        plan_views.invalidate(user_id)
+
+
+def flush_results(_conn, plan_views, progress_path, results):
+    # Returns the number of plans written. A failed write is recorded and the run goes on;
+    # --retry-failed generates those users again.
+    try:
+        write_results(_conn, plan_views, results)
+    except Exception as e:
+        print(f"Writing {len(results)} plans failed: {e}")
+        append_progress(progress_path, [{"user_id": uid, "status": "failed", "error": f"Write failed: {e}"} for uid, _, _ in results])
+        return 0
+    append_progress(progress_path, [{"user_id": uid, "status": "done"} for uid, _, _ in results])
+    return len(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate career plans for many users at once.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--user-ids', help="File with one user_id per line")
+    source.add_argument('--query', choices=['all', 'missing-plan'], help="Select users from user_info")
+    parser.add_argument('--workers', type=int, default=4, help="Plans generated concurrently")
+    parser.add_argument('--write-batch', type=int, default=20, help="Plans written per bulk insert")
+    parser.add_argument('--progress', default='batch_progress.jsonl', help="Progress file used to resume")
+    parser.add_argument('--run-name', help="Plan run id for this backfill (defaults to the one in the progress file)")
+    parser.add_argument('--retry-failed', action='store_true', help="Also retry users that failed previously")
+    parser.add_argument('--rpm', type=float, help="Gemini requests/min for this host (defaults to GEMINI_RPM)")
+    parser.add_argument('--tpm', type=float, help="Gemini tokens/min for this host (defaults to GEMINI_TPM)")
+    args = parser.parse_args()
+
+    load_dotenv()
+    _conn = init_connection()
+
+    run_name, done, failed = load_progress(args.progress)
+    if run_name is None:
+        run_name = args.run_name or f"batch-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        append_progress(args.progress, [{"run_name": run_name}])
+    elif args.run_name and args.run_name != run_name:
+        parser.error(f"{args.progress} belongs to run {run_name}; use another progress file for a new run")
+
+    user_ids = read_user_ids(_conn, args.user_ids, args.query)
+    skip = done if args.retry_failed else done | failed
+    pending = [user_id for user_id in dict.fromkeys(user_ids) if user_id not in skip]
+    print(f"Run {run_name}: {len(user_ids)} users selected, {len(pending)} to generate ({len(done)} already done)")
+    if not pending:
+        return
+
+    users = get_users_info(_conn, pending)
+    missing = [user_id for user_id in pending if user_id not in users]
+    if missing:
+        print(f"Skipping {len(missing)} user(s) without a profile")
+        append_progress(args.progress, [{"user_id": user_id, "status": "failed", "error": "No profile"} for user_id in missing])
+
+    # Every plan call goes through the host-wide rate governor at background priority,
+    # so a backfill never takes the capacity reserved for live chat traffic
+    governor = RateGovernor(requests_per_minute=args.rpm, tokens_per_minute=args.tpm)
+    planner = PlanningAgent(llm_caller=LLMCaller(governor=governor))
+    extractor = ResumeExtractor(_conn, max_workers=args.workers)
+    plan_views = PlanViewCache(_conn)
+
+    start_time = time.time()
+    completed = 0
+    results = []
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = {
+            executor.submit(generate_user_plan, planner, extractor, users[user_id], run_name): user_id
+            for user_id in pending if user_id in users
+        }
+        for future in as_completed(futures):
+            user_id = futures[future]
+            try:
+                themes, tasks = future.result()
+                results.append((user_id, themes, tasks))
+            except Exception as e:
+                print(f"Plan generation failed for {user_id}: {e}")
+                append_progress(args.progress, [{"user_id": user_id, "status": "failed", "error": str(e)}])
+
+            if len(results) >= args.write_batch:
+                completed += flush_results(_conn, plan_views, args.progress, results)
+                results = []
+                print(f"{completed}/{len(futures)} plans written in {time.time() - start_time:.0f} seconds")
+
+    if results:
+        completed += flush_results(_conn, plan_views, args.progress, results)
+
+    print(f"Batch complete: {completed} plans written in {time.time() - start_time:.0f} seconds")
+    print(f"LLM call stats: {planner.llm_caller.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+# Words and phrases that point back at something shown in the previous answer
+_REFERENCES = {"those", "these", "them", "ones", "above", "aforementioned", "mentioned", "listed"}
+_REFERENCE_PHRASES = re.compile(r"\b(which one|that one|this one|the (first|second|third|last) one|of (them|those|these)|"
+                                r"(is|are|does|do|did|will|would|can) (it|they)|about it)\b")
+# Comparisons that, in a very short message, only make sense against results already shown
+_COMPARISONS = {
+    "shortest", "longest", "easiest", "hardest", "cheapest", "quickest", "fastest",
+    "highest", "lowest", "shorter", "longer", "easier", "harder", "cheaper",
+}
+_CONTINUATIONS = ("and ", "also ", "what about", "how about", "tell me more", "more about")
+# Words that do not name a subject of their own: a follow-up may only add these to the previous turn
+_GENERIC = set("""a an the and or but of for to in on at by with about from into is are was were be been it its
+this that there here which what who how why when where do does did can could would should will i me my you your they their
+we our any some all more most less best good great better top recommend recommended suggest suggestions
+has have had much many need needs get offer offers include includes cover covers teach teaches
+course courses class classes program programs certificate certification certifications learn learning study
+take tell show give list also else other another same instead one ones please thanks ok okay
+free paid online cheap expensive price prices fee fees cost costs long length time hour hours day days week weeks
+month months duration take takes last lasts level levels beginner beginners
+intermediate advanced expert experts rating ratings rate rated review reviews difficulty easy hard first second third last""".split()) | _REFERENCES | _COMPARISONS
+
+
+def _terms(text: str) -> set:
+    # Lower-case words with a plural "s" dropped, so "course" and "courses" compare equal
+    return {word[:-1] if len(word) > 3 and word.endswith("s") else word for word in re.findall(r"[a-z0-9+#']+", text.lower())}
+
+
+_GENERIC_TERMS = _terms(" ".join(_GENERIC))
+
+
+def is_follow_up(query: str, previous: Optional[dict], max_words: int = 12) -> bool:
+    """Cheap check whether a message refers back to the previous turn's results.
+
+    A message that names a course from the previous answer is a follow-up. Otherwise only
+    short messages with an explicit back-reference ("which of those is shortest?", "what
+    about for beginners?") are, and only if they bring no subject of their own: "what about
+    Kubernetes courses?" gets a fresh retrieval."""
+    if not previous:
+        return False
+    text = query.lower().strip()
+    words = re.findall(r"[a-z0-9']+", text)
+    if not words:
+        return False
+
+    # Naming a course from the previous answer is a follow-up at any length
+    for title in previous.get("course_titles", []):
+        if title and len(title) >= 8 and title.lower() in text:
+            return True
+
+    if len(words) > max_words:
+        return False
+    known = _terms(" ".join([previous.get("query", "")] + [title or "" for title in previous.get("course_titles", [])]))
+    if _terms(text) - _GENERIC_TERMS - known:
+        return False
+    if text.startswith(_CONTINUATIONS) or _REFERENCES.intersection(words) or _REFERENCE_PHRASES.search(text):
+        return True
+    return len(words) <= 6 and bool(_COMPARISONS.intersection(words))
+
+
+class RetrievalContextStore:
+    """Last turn's retrieval results (courses and web snippets) per chat session.
+
+    Sessions expire after the TTL and the least recently used session is dropped once
+    the store is full."""
+
+    def __init__(self, ttl_seconds: Optional[float] = None, max_sessions: Optional[int] = None):
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.getenv("CHAT_SESSION_TTL", 1800))
+        self.max_sessions = max_sessions if max_sessions is not None else int(os.getenv("CHAT_SESSION_MAX", 5000))
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()
+        self._reused = 0
+        self._retrieved = 0
+
+    def get(self, session_id: Optional[str]) -> Optional[dict]:
+        if not session_id:
+            return None
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            if time.time() - entry["updated_at"] > self.ttl_seconds:
+                del self._sessions[session_id]
+                return None
+            self._sessions.move_to_end(session_id)
+            return entry
+
+    def save(self, session_id: Optional[str], query: str, contexts: List[Dict], reused: bool):
+        if not session_id:
+            return
+        with self._lock:
+            if reused:
+                self._reused += 1
+                entry = self._sessions.get(session_id)
+                if entry is not None:
+                    # The reused results stay the reference point for the next follow-up
+                    entry["updated_at"] = time.time()
+                    return
+            else:
+                self._retrieved += 1
+
+            courses = next((ctx["content"] for ctx in contexts if ctx["source"] == "course_recommendations"), [])
+            self._sessions[session_id] = {
+                "query": query,
+                "contexts": contexts,
+                "course_titles": [course.get("title") for course in courses],
+                "updated_at": time.time()
+            }
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            turns = self._reused + self._retrieved
+            return {
+                "sessions": len(self._sessions),
+                "reused": self._reused,
+                "retrieved": self._retrieved,
+                "reuse_rate": round(self._reused / turns, 3) if turns else 0.0
+            }
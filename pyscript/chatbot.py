@@ -8,7 +8,14 @@ from langchain_community.tools import DuckDuckGoSearchRun
 from langgraph.graph import StateGraph, END
 from typing import Dict, TypedDict, List
 import json
-from supabase import create_client, Client
+from supabase import create_client, acreate_client, Client
+from langchain_core.runnables import RunnableLambda
+from llm_calls import LLMCaller, gemini_client_kwargs
+from rate_limiter import estimate_tokens, INTERACTIVE
+from answer_cache import SemanticAnswerCache
+from chat_context import RetrievalContextStore, is_follow_up
+from model_router import ModelRouter
+from embedding_batcher import EmbeddingBatcher
 
 load_dotenv()
 
@@ -17,47 +24,131 @@ class AgentState(TypedDict):
     contexts: List[Dict]
     final_answer: str
     conversation_history: List[Dict]
+    query_embedding: List[float]
+    cache_hit: bool
+    session_id: str
+    reused_context: bool
 
 class CourseRecommendationChatbot:
-    def __init__(self):
+    def __init__(self, llm_caller: LLMCaller = None, answer_cache: SemanticAnswerCache = None,
+                 retrieval_contexts: RetrievalContextStore = None, model_router: ModelRouter = None,
+                 embedding_batcher: EmbeddingBatcher = None):
         self.supabase_url = os.getenv("REACT_APP_SUPABASE_URL")
         self.supabase_key = os.getenv("SUPABASE_SECRET_KEY")
         self.google_api_key = os.getenv("GOOGLE_API_KEY")
         
         self.supabase = create_client(self.supabase_url, self.supabase_key)
-        self.embeddings = GoogleGenerativeAIEmbeddings(model="models/text-embedding-004", google_api_key=self.google_api_key)
+        # Async Supabase client, created by asetup() on the serving event loop
+        self.async_supabase = None
+        self.embeddings = GoogleGenerativeAIEmbeddings(model="models/text-embedding-004", google_api_key=self.google_api_key, **gemini_client_kwargs())
+        # Query embeddings of concurrent chats are sent to Gemini together, one batched request
+        self.embedding_batcher = embedding_batcher or EmbeddingBatcher(self.embeddings)
         self.search_tool = DuckDuckGoSearchRun()
-        self.llm = ChatGoogleGenerativeAI(model="gemini-1.5-flash-001", google_api_key=self.google_api_key)
+        # CHAT_WEB_SEARCH=0 answers from course recommendations only (used by the load tests)
+        self.web_search_enabled = os.getenv("CHAT_WEB_SEARCH", "1") != "0"
+        # The answer model is picked per call by the router; one client per model, created on first use
+        self.model_router = model_router or ModelRouter()
+        self._chat_models = {}
+        self.llm_caller = llm_caller or LLMCaller()
+        # Answers to history-independent questions, reused for near-identical queries
+        self.answer_cache = answer_cache or SemanticAnswerCache()
+        # Last turn's courses and search results per chat session, reused by follow-up questions
+        self.retrieval_contexts = retrieval_contexts or RetrievalContextStore()
 
         self.agent = self.create_agent()
 
     def create_agent(self):
         workflow = StateGraph(AgentState)
 
-        workflow.add_node("get_course_recommendations", self.get_course_recommendations)
-        workflow.add_node("search_web", self.search_web)
-        workflow.add_node("generate_answer", self.generate_answer)
+        # Each node has an async twin, used when the graph runs on an event loop (asgi.py)
+        workflow.add_node("get_course_recommendations", RunnableLambda(self.get_course_recommendations, afunc=self.aget_course_recommendations))
+        workflow.add_node("search_web", RunnableLambda(self.search_web, afunc=self.asearch_web))
+        workflow.add_node("generate_answer", RunnableLambda(self.generate_answer, afunc=self.agenerate_answer))
+        workflow.add_node("reuse_context", self.reuse_context)
 
-        workflow.set_entry_point("get_course_recommendations")
-        workflow.add_edge("get_course_recommendations", "search_web")
+        # Follow-ups answer from the previous turn's results without embedding, RPC or web search
+        workflow.set_conditional_entry_point(self.route_query)
+        workflow.add_edge("reuse_context", "generate_answer")
+        # A cached answer ends the run before the web search and the Gemini generation
+        workflow.add_conditional_edges("get_course_recommendations", self.route_after_recommendations)
         workflow.add_edge("search_web", "generate_answer")
         workflow.add_edge("generate_answer", END)
 
         return workflow.compile()
 
+    def route_query(self, state: AgentState) -> str:
+        if self.is_context_free(state):
+            return "get_course_recommendations"
+        if is_follow_up(state["query"], self.retrieval_contexts.get(state["session_id"])):
+            return "reuse_context"
+        return "get_course_recommendations"
+
+    def reuse_context(self, state: AgentState) -> AgentState:
+        previous = self.retrieval_contexts.get(state["session_id"])
+        state["contexts"] = list(previous["contexts"]) if previous else []
+        state["reused_context"] = True
+        return state
+
+    def remember_context(self, state: AgentState):
+        self.retrieval_contexts.save(state["session_id"], state["query"], state["contexts"], state["reused_context"])
+
+    def route_after_recommendations(self, state: AgentState) -> str:
+        return END if state.get("cache_hit") else "search_web"
+
+    def is_context_free(self, state: AgentState) -> bool:
+        # The client sends the current query as the last history entry; anything before it
+        # means the answer may depend on the conversation
+        history = state["conversation_history"]
+        if history and history[-1].get("content") == state["query"]:
+            history = history[:-1]
+        return not history
+
+    def serve_cached_answer(self, state: AgentState) -> bool:
+        if not self.is_context_free(state):
+            return False
+        cached = self.answer_cache.lookup(state["query_embedding"])
+        if cached is None:
+            return False
+        state["final_answer"], contexts = cached
+        state["contexts"] = list(contexts)
+        state["cache_hit"] = True
+        # The run ends here, so the cached answer's results become the session's reference point now
+        self.remember_context(state)
+        return True
+
+    def cache_answer(self, state: AgentState):
+        if self.is_context_free(state) and state.get("query_embedding"):
+            self.answer_cache.store(state["query"], state["query_embedding"], state["final_answer"], state["contexts"])
+
+    async def asetup(self):
+        self.async_supabase = await acreate_client(self.supabase_url, self.supabase_key)
+
+    def match_courses_params(self, query_embedding: List[float]) -> dict:
+        return {
+            'query_embedding': query_embedding,
+            'match_threshold': 0.5,
+            'match_count': 3
+        }
+
     def get_course_recommendations(self, state: AgentState) -> AgentState:
-        query_embedding = self.embeddings.embed_query(state["query"])
+        state["query_embedding"] = query_embedding = self.embedding_batcher.embed_query(state["query"])
+        if self.serve_cached_answer(state):
+            return state
         
-        response = self.supabase.rpc(
-            'match_courses',
-            {
-                'query_embedding': query_embedding,
-                'match_threshold': 0.5,
-                'match_count': 3
-            }
-        ).execute()
+        response = self.supabase.rpc('match_courses', self.match_courses_params(query_embedding)).execute()
+        return self.add_courses(state, response.data)
+
+    async def aget_course_recommendations(self, state: AgentState) -> AgentState:
+        if self.async_supabase is None:
+            await self.asetup()
+        state["query_embedding"] = query_embedding = await self.embedding_batcher.aembed_query(state["query"])
+        if self.serve_cached_answer(state):
+            return state
 
-        results = response.data
+        response = await self.async_supabase.rpc('match_courses', self.match_courses_params(query_embedding)).execute()
+        return self.add_courses(state, response.data)
+
+    def add_courses(self, state: AgentState, results: List[Dict]) -> AgentState:
         courses = []
         for item in results:
             course = {
@@ -73,11 +164,24 @@ class CourseRecommendationChatbot:
         return state
 
     def search_web(self, state: AgentState) -> AgentState:
-        search_results = self.search_tool.run(state["query"])
+        search_results = self.search_tool.run(state["query"]) if self.web_search_enabled else ""
         state["contexts"].append({"source": "web_search", "content": search_results})
         return state
 
-    def generate_answer(self, state: AgentState) -> AgentState:
+    async def asearch_web(self, state: AgentState) -> AgentState:
+        search_results = await self.search_tool.ainvoke(state["query"]) if self.web_search_enabled else ""
+        state["contexts"].append({"source": "web_search", "content": search_results})
+        return state
+
+    def chat_model(self, model_name: str) -> ChatGoogleGenerativeAI:
+        llm = self._chat_models.get(model_name)
+        if llm is None:
+            # Retries are owned by self.llm_caller, so the client itself does not retry
+            llm = ChatGoogleGenerativeAI(model=model_name, google_api_key=self.google_api_key, max_retries=1, **gemini_client_kwargs())
+            self._chat_models[model_name] = llm
+        return llm
+
+    def answer_inputs(self, state: AgentState):
         course_recommendations = next((ctx for ctx in state["contexts"] if ctx["source"] == "course_recommendations"), None)
         web_search_results = next((ctx for ctx in state["contexts"] if ctx["source"] == "web_search"), None)
 
@@ -115,24 +219,57 @@ class CourseRecommendationChatbot:
             input_variables=["conversation_history", "course_recommendations", "web_search_results", "query"]
         )
 
-        chain = PROMPT | self.llm
-
-        response = chain.invoke({
+        return PROMPT, {
             "conversation_history": json.dumps(state["conversation_history"][-10:]),
             "course_recommendations": json.dumps(course_recommendations["content"] if course_recommendations else []),
             "web_search_results": web_search_results["content"] if web_search_results else "",
             "query": state["query"]
-        })
+        }
+
+    def generate_answer(self, state: AgentState) -> AgentState:
+        prompt, inputs = self.answer_inputs(state)
+        attempt = self.model_router.attempt("chat_answer", lambda model_name: (prompt | self.chat_model(model_name)).invoke(inputs))
+        response = self.llm_caller.call("chat_answer", attempt, priority=INTERACTIVE, tokens=estimate_tokens(inputs))
+
+        state["final_answer"] = response.content if hasattr(response, 'content') else str(response)
+        self.cache_answer(state)
+        self.remember_context(state)
+        return state
+
+    async def agenerate_answer(self, state: AgentState) -> AgentState:
+        prompt, inputs = self.answer_inputs(state)
+        attempt = self.model_router.aattempt("chat_answer", lambda model_name: (prompt | self.chat_model(model_name)).ainvoke(inputs))
+        response = await self.llm_caller.acall("chat_answer", attempt, priority=INTERACTIVE, tokens=estimate_tokens(inputs))
 
         state["final_answer"] = response.content if hasattr(response, 'content') else str(response)
+        self.cache_answer(state)
+        self.remember_context(state)
         return state
 
-    def get_answer(self, query: str, conversation_history: List[Dict]) -> str:
+    def get_answer(self, query: str, conversation_history: List[Dict], session_id: str = None) -> str:
         initial_state = AgentState(
             query=query, 
             contexts=[], 
             final_answer="", 
-            conversation_history=conversation_history[-10:]  # Limit to last 10 interactions
+            conversation_history=conversation_history[-10:],  # Limit to last 10 interactions
+            query_embedding=[],
+            cache_hit=False,
+            session_id=session_id or "",
+            reused_context=False
         )
         result = self.agent.invoke(initial_state)
         return result["final_answer"]
+
+    async def aget_answer(self, query: str, conversation_history: List[Dict], session_id: str = None) -> str:
+        initial_state = AgentState(
+            query=query, 
+            contexts=[], 
+            final_answer="", 
+            conversation_history=conversation_history[-10:],  # Limit to last 10 interactions
+            query_embedding=[],
+            cache_hit=False,
+            session_id=session_id or "",
+            reused_context=False
+        )
+        result = await self.agent.ainvoke(initial_state)
+        return result["final_answer"]
@@ -0,0 +1,110 @@
+import os
+import json
+import time
+import threading
+from typing import Dict, List, Optional
+import numpy as np
+from langchain_google_genai import GoogleGenerativeAIEmbeddings
+from llm_calls import gemini_client_kwargs
+from utils import init_connection
+
+# Links every task of a generated plan to the closest courses in our own catalog, so the
+# dashboard can show them without a chat round-trip per task. The links are stored with
+# the task rows, in a column added by migrations/001_course_links.sql; linking stays off
+# (COURSE_LINKING=0) until that migration has been applied.
+#
+# The catalog (title, URL and embedding of every course) is loaded once per process and
+# matched in memory; a plan costs one embed_documents call for all of its tasks.
+
+COURSE_COLUMNS = 'title,course_url,rating,duration,difficulty,embedding'
+
+
+def course_linking_enabled() -> bool:
+    # Also decides whether the dashboard reads the course_links column
+    return os.getenv("COURSE_LINKING", "0") == "1"
+
+
+class CourseCatalog:
+    def __init__(self, _conn=None, ttl_seconds: Optional[float] = None, page_size: int = 1000):
+        self._conn = _conn
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.getenv("COURSE_CATALOG_TTL", 3600))
+        self.page_size = page_size
+        self._lock = threading.Lock()
+        self._courses: List[Dict] = []
+        self._matrix: Optional[np.ndarray] = None
+        self._loaded_at = 0.0
+
+    def load(self):
+        if self._conn is None:
+            self._conn = init_connection()
+        courses, vectors = [], []
+        offset = 0
+        # PostgREST caps rows per response, so page through the table
+        while True:
+            rows = self._conn.table('courses').select(COURSE_COLUMNS).range(offset, offset + self.page_size - 1).execute().data
+            for row in rows:
+                embedding = row.pop('embedding')
+                if not embedding:
+                    continue
+                # pgvector columns come back as a "[0.1,0.2,...]" string
+                vectors.append(json.loads(embedding) if isinstance(embedding, str) else embedding)
+                courses.append(row)
+            if len(rows) < self.page_size:
+                break
+            offset += self.page_size
+
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if len(matrix):
+            # Unit rows, so a matrix product gives cosine similarities
+            matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        self._courses, self._matrix, self._loaded_at = courses, matrix, time.time()
+        print(f"Loaded {len(courses)} courses for task linking")
+
+    def snapshot(self):
+        with self._lock:
+            if self._matrix is None or time.time() - self._loaded_at > self.ttl_seconds:
+                self.load()
+            return self._courses, self._matrix
+
+
+class CourseLinker:
+    def __init__(self, catalog: CourseCatalog = None, embeddings=None, top_k: Optional[int] = None,
+                 threshold: Optional[float] = None):
+        self.catalog = catalog or CourseCatalog()
+        self.embeddings = embeddings or GoogleGenerativeAIEmbeddings(model="models/text-embedding-004", google_api_key=os.getenv("GOOGLE_API_KEY"),
+                                                                     **gemini_client_kwargs())
+        self.top_k = top_k or int(os.getenv("COURSE_LINK_TOP_K", 3))
+        # Same cut-off as the match_courses RPC used by the chatbot
+        self.threshold = threshold if threshold is not None else float(os.getenv("COURSE_LINK_THRESHOLD", 0.5))
+
+    def link(self, task_outlines: List[str]) -> List[List[Dict]]:
+        # One list of course links per task, best match first
+        if not task_outlines:
+            return []
+        courses, matrix = self.catalog.snapshot()
+        if not courses:
+            return [[] for _ in task_outlines]
+
+        # Tasks play the role of search queries, like the course embeddings themselves (embed_query)
+        vectors = np.asarray(self.embeddings.embed_documents(task_outlines, task_type="retrieval_query"), dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        scores = vectors @ matrix.T
+
+        k = min(self.top_k, len(courses))
+        # Top k per task without sorting the whole catalog, then order those k
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top, top_scores = np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+        links = []
+        for indices, similarities in zip(top, top_scores):
+            links.append([{
+                'title': courses[i]['title'],
+                'url': courses[i]['course_url'],
+                'rating': courses[i].get('rating'),
+                'duration': courses[i].get('duration'),
+                'difficulty': courses[i].get('difficulty'),
+                'similarity': round(float(similarity), 3)
+            } for i, similarity in zip(indices, similarities) if similarity >= self.threshold])
+        return links
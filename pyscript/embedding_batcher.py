@@ -0,0 +1,142 @@
+import os
+import time
+import queue
+import asyncio
+import threading
+from collections import Counter
+from concurrent.futures import Future, InvalidStateError, TimeoutError as FutureTimeoutError
+from typing import List, Optional
+
+# Gemini's batchEmbedContents accepts at most 100 texts per request
+MAX_BATCH_LIMIT = 100
+
+
+class EmbeddingBatcher:
+    """Coalesces embed_query calls from all request threads (and event loops) of a worker
+    into batched embed_documents calls.
+
+    A background thread takes the first waiting query, collects more for up to
+    EMBED_BATCH_WAIT_MS or until EMBED_BATCH_SIZE texts, embeds them in one request and
+    hands each caller its vector. Identical texts in a batch are embedded once."""
+
+    def __init__(self, embeddings, max_batch: Optional[int] = None, max_wait_ms: Optional[float] = None,
+                 timeout: Optional[float] = None):
+        self.embeddings = embeddings
+        self.max_batch = min(max_batch or int(os.getenv("EMBED_BATCH_SIZE", 32)), MAX_BATCH_LIMIT)
+        self.max_wait = (max_wait_ms if max_wait_ms is not None else float(os.getenv("EMBED_BATCH_WAIT_MS", 5))) / 1000.0
+        # Upper bound on how long a request thread waits for its vector
+        self.timeout = timeout if timeout is not None else float(os.getenv("EMBED_TIMEOUT", 30))
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._sizes = Counter()
+        self._flushes = Counter()
+        self._queued_seconds = 0.0
+        self._items = 0
+        self._deduplicated = 0
+        self._errors = 0
+        self._cancelled = 0
+
+    def _ensure_worker(self):
+        # Started on first use, so that it runs in the worker process and not in a pre-fork parent
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                self._thread.start()
+
+    def submit(self, text: str) -> Future:
+        future = Future()
+        if self.max_batch <= 1:
+            # Batching disabled: embed inline, one request per query
+            try:
+                future.set_result(self.embeddings.embed_query(text))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        self._ensure_worker()
+        self._queue.put((text, future, time.monotonic()))
+        return future
+
+    def embed_query(self, text: str) -> List[float]:
+        future = self.submit(text)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            # Still queued: drop it so the batch does not embed it for nobody
+            future.cancel()
+            raise
+
+    async def aembed_query(self, text: str) -> List[float]:
+        # Cancelling the await (client disconnect) or timing out cancels the queued future
+        return await asyncio.wait_for(asyncio.wrap_future(self.submit(text)), timeout=self.timeout)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            reason = "full"
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    reason = "timeout"
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    reason = "timeout"
+                    break
+            try:
+                self._flush(batch, reason)
+            except Exception as e:
+                # Whatever went wrong, no caller of this batch is left waiting
+                for _, future, _ in batch:
+                    try:
+                        future.set_exception(e)
+                    except InvalidStateError:
+                        # Already resolved or cancelled
+                        pass
+                with self._lock:
+                    self._errors += 1
+
+    def _flush(self, batch, reason: str):
+        started = time.monotonic()
+        # Callers that gave up (cancelled await, timed-out request) are skipped; the rest can no longer be cancelled
+        pending = [item for item in batch if item[1].set_running_or_notify_cancel()]
+        with self._lock:
+            self._cancelled += len(batch) - len(pending)
+        if not pending:
+            return
+        batch = pending
+        texts = list(dict.fromkeys(text for text, _, _ in batch))
+        # Same task type as embed_query, so vectors match the course and cache embeddings
+        vectors = self.embeddings.embed_documents(texts, task_type="retrieval_query")
+        if len(vectors) != len(texts):
+            raise ValueError(f"Expected {len(texts)} embeddings, got {len(vectors)}")
+        vectors = dict(zip(texts, vectors))
+
+        for text, future, _ in batch:
+            future.set_result(vectors[text])
+        with self._lock:
+            self._sizes[len(batch)] += 1
+            self._flushes[reason] += 1
+            self._items += len(batch)
+            self._deduplicated += len(batch) - len(texts)
+            self._queued_seconds += sum(started - queued_at for _, _, queued_at in batch)
+
+    def stats(self) -> dict:
+        with self._lock:
+            batches = sum(self._sizes.values())
+            return {
+                "max_batch": self.max_batch,
+                "max_wait_ms": round(self.max_wait * 1000, 1),
+                "batches": batches,
+                "items": self._items,
+                "mean_batch_size": round(self._items / batches, 2) if batches else 0.0,
+                "mean_fill": round(self._items / (batches * self.max_batch), 3) if batches else 0.0,
+                "mean_queue_ms": round(self._queued_seconds / self._items * 1000, 2) if self._items else 0.0,
+                "deduplicated": self._deduplicated,
+                "errors": self._errors,
+                "cancelled": self._cancelled,
+                "flushes": dict(self._flushes),
+                "batch_sizes": {str(size): count for size, count in sorted(self._sizes.items())}
+            }
@@ -0,0 +1,297 @@
+import os
+import time
+import asyncio
+import random
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, Dict, Optional
+
+from google.api_core import exceptions as google_exceptions
+
+from rate_limiter import RateGovernor, BACKGROUND
+
+
+class LLMCallTimeout(TimeoutError):
+    pass
+
+
+class PlanBudgetExceeded(TimeoutError):
+    pass
+
+
+# Errors worth another attempt: quota, overload, transient server and network failures
+RETRYABLE_ERRORS = (
+    LLMCallTimeout,
+    ConnectionError,
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.TooManyRequests,
+)
+
+def gemini_client_kwargs() -> dict:
+    # GEMINI_API_ENDPOINT points every Gemini client at another server, e.g. the load-test mocks
+    endpoint = os.getenv("GEMINI_API_ENDPOINT")
+    if not endpoint:
+        return {}
+    return {"transport": "rest", "client_options": {"api_endpoint": endpoint}}
+
+
+def parse_verdict(value, default: bool) -> bool:
+    # Checker JSON sometimes carries the verdict as a string; bool("false") would be True
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        return value != 0
+    if isinstance(value, str):
+        text = value.strip().lower()
+        if text in ("true", "yes", "pass", "passed", "1"):
+            return True
+        if text in ("false", "no", "fail", "failed", "0"):
+            return False
+    return default
+
+
+# Absolute (monotonic) deadline of the plan currently being generated, if any.
+# A ContextVar so that it follows the call into LangGraph's executor threads.
+_plan_deadline: contextvars.ContextVar = contextvars.ContextVar("plan_deadline", default=None)
+
+
+class LLMCaller:
+    """Runs LLM calls with a per-request deadline, jittered exponential retries
+    bounded by the plan-level time budget, and optional p95 hedging. Every attempt
+    is admitted through the shared RateGovernor first."""
+
+    def __init__(self,
+                 request_timeout: Optional[float] = None,
+                 max_retries: Optional[int] = None,
+                 base_delay: Optional[float] = None,
+                 max_delay: Optional[float] = None,
+                 hedging: Optional[bool] = None,
+                 hedge_quantile: float = 0.95,
+                 hedge_min_samples: int = 20,
+                 max_workers: int = 32,
+                 governor: Optional[RateGovernor] = None):
+        self.request_timeout = request_timeout if request_timeout is not None else float(os.getenv("LLM_REQUEST_TIMEOUT", 60))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("LLM_MAX_RETRIES", 3))
+        self.base_delay = base_delay if base_delay is not None else float(os.getenv("LLM_RETRY_BASE_DELAY", 1.0))
+        self.max_delay = max_delay if max_delay is not None else float(os.getenv("LLM_RETRY_MAX_DELAY", 20.0))
+        self.hedging = hedging if hedging is not None else os.getenv("LLM_HEDGING", "0") == "1"
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        if governor is None and os.getenv("GEMINI_RATE_LIMIT", "1") == "1":
+            governor = RateGovernor()
+        self.governor = governor
+
+        # Abandoned (timed out or losing hedge) calls keep running here until they return
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-call")
+        self._lock = threading.Lock()
+        self._latencies: Dict[str, deque] = {}
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    @contextmanager
+    def plan_budget(self, seconds: Optional[float] = None):
+        if seconds is None:
+            seconds = float(os.getenv("PLAN_TIME_BUDGET", 600))
+        token = _plan_deadline.set(time.monotonic() + seconds)
+        try:
+            yield
+        finally:
+            _plan_deadline.reset(token)
+
+    def call(self, name: str, fn: Callable, *args, priority: str = BACKGROUND, tokens: int = 0, **kwargs) -> Any:
+        attempt = 0
+        while True:
+            timeout = self._attempt_timeout(name)
+            try:
+                return self._run_attempt(name, fn, args, kwargs, timeout, priority, tokens)
+            except RETRYABLE_ERRORS as e:
+                if self.governor is not None and isinstance(e, (google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests)):
+                    self.governor.drain()
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                remaining = self._remaining_budget()
+                if remaining is not None and delay >= remaining:
+                    raise PlanBudgetExceeded(f"{name}: plan time budget exhausted after {attempt + 1} attempts") from e
+                self._count(name, "retries")
+                print(f"Retrying {name} in {delay:.1f}s after error: {e}")
+                time.sleep(delay)
+                attempt += 1
+
+    async def acall(self, name: str, fn: Callable, *args, priority: str = BACKGROUND, tokens: int = 0, **kwargs) -> Any:
+        # Same policy as call() for coroutine functions (e.g. chain.ainvoke); runs on the caller's event loop
+        attempt = 0
+        while True:
+            timeout = self._attempt_timeout(name)
+            try:
+                return await self._arun_attempt(name, fn, args, kwargs, timeout, priority, tokens)
+            except RETRYABLE_ERRORS as e:
+                if self.governor is not None and isinstance(e, (google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests)):
+                    await self.governor.adrain()
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                remaining = self._remaining_budget()
+                if remaining is not None and delay >= remaining:
+                    raise PlanBudgetExceeded(f"{name}: plan time budget exhausted after {attempt + 1} attempts") from e
+                self._count(name, "retries")
+                print(f"Retrying {name} in {delay:.1f}s after error: {e}")
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            report = {}
+            for name, counts in self._stats.items():
+                entry = dict(counts)
+                hedged = entry.get("hedged", 0)
+                entry["hedge_win_rate"] = round(entry.get("hedge_wins", 0) / hedged, 3) if hedged else 0.0
+                p95 = self._quantile_locked(name, self.hedge_quantile)
+                entry["p95_seconds"] = round(p95, 3) if p95 is not None else None
+                report[name] = entry
+            return report
+
+    def _remaining_budget(self) -> Optional[float]:
+        deadline = _plan_deadline.get()
+        if deadline is None:
+            return None
+        return deadline - time.monotonic()
+
+    def _attempt_timeout(self, name: str) -> float:
+        remaining = self._remaining_budget()
+        if remaining is None:
+            return self.request_timeout
+        if remaining <= 0:
+            raise PlanBudgetExceeded(f"{name}: plan time budget exhausted")
+        return min(self.request_timeout, remaining)
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter: uniform over [0, min(max_delay, base * 2^attempt)]
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def _hedge_delay(self, name: str) -> Optional[float]:
+        if not self.hedging:
+            return None
+        with self._lock:
+            if len(self._latencies.get(name, ())) < self.hedge_min_samples:
+                return None
+            return self._quantile_locked(name, self.hedge_quantile)
+
+    def _quantile_locked(self, name: str, q: float) -> Optional[float]:
+        samples = self._latencies.get(name)
+        if not samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def _record(self, name: str, latency: float):
+        with self._lock:
+            self._latencies.setdefault(name, deque(maxlen=200)).append(latency)
+            self._stats.setdefault(name, {}).setdefault("calls", 0)
+            self._stats[name]["calls"] += 1
+
+    def _count(self, name: str, key: str):
+        with self._lock:
+            counts = self._stats.setdefault(name, {})
+            counts[key] = counts.get(key, 0) + 1
+
+    def _submit(self, fn: Callable, args: tuple, kwargs: dict):
+        ctx = contextvars.copy_context()
+        return self._executor.submit(ctx.run, fn, *args, **kwargs)
+
+    def _run_attempt(self, name: str, fn: Callable, args: tuple, kwargs: dict, timeout: float,
+                     priority: str, tokens: int) -> Any:
+        if self.governor is not None:
+            max_wait = min(timeout, self.governor.max_wait.get(priority, timeout))
+            queued = self.governor.acquire(tokens, priority, max_wait=max_wait)
+            if queued > 0.5:
+                self._count(name, "rate_queued")
+            timeout -= queued
+        start = time.monotonic()
+        deadline = start + timeout
+        primary = self._submit(fn, args, kwargs)
+        pending = {primary}
+        hedge = None
+
+        hedge_after = self._hedge_delay(name)
+        if hedge_after is not None and hedge_after < timeout:
+            done, _ = wait(pending, timeout=hedge_after)
+            # A hedge is only worth sending if it fits in the shared rate budget right now
+            if not done and (self.governor is None or self.governor.try_acquire(tokens, priority)):
+                hedge = self._submit(fn, args, kwargs)
+                pending.add(hedge)
+                self._count(name, "hedged")
+
+        last_error = None
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                error = future.exception()
+                if error is None:
+                    self._record(name, time.monotonic() - start)
+                    if future is hedge:
+                        self._count(name, "hedge_wins")
+                    return future.result()
+                last_error = error
+            if last_error is not None and not pending:
+                self._count(name, "errors")
+                raise last_error
+
+        self._count(name, "timeouts")
+        raise LLMCallTimeout(f"{name}: no response within {timeout:.1f}s")
+
+    async def _arun_attempt(self, name: str, fn: Callable, args: tuple, kwargs: dict, timeout: float,
+                            priority: str, tokens: int) -> Any:
+        if self.governor is not None:
+            max_wait = min(timeout, self.governor.max_wait.get(priority, timeout))
+            queued = await self.governor.aacquire(tokens, priority, max_wait=max_wait)
+            if queued > 0.5:
+                self._count(name, "rate_queued")
+            timeout -= queued
+        start = time.monotonic()
+        deadline = start + timeout
+        primary = asyncio.ensure_future(fn(*args, **kwargs))
+        pending = {primary}
+        hedge = None
+
+        try:
+            hedge_after = self._hedge_delay(name)
+            if hedge_after is not None and hedge_after < timeout:
+                done, _ = await asyncio.wait(pending, timeout=hedge_after)
+                if not done and (self.governor is None or await self.governor.atry_acquire(tokens, priority)):
+                    hedge = asyncio.ensure_future(fn(*args, **kwargs))
+                    pending.add(hedge)
+                    self._count(name, "hedged")
+
+            last_error = None
+            while pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    error = task.exception()
+                    if error is None:
+                        self._record(name, time.monotonic() - start)
+                        if task is hedge:
+                            self._count(name, "hedge_wins")
+                        return task.result()
+                    last_error = error
+                if last_error is not None and not pending:
+                    self._count(name, "errors")
+                    raise last_error
+        finally:
+            # Unlike threads, the losing or timed-out coroutines can actually be cancelled
+            for task in pending:
+                task.cancel()
+
+        self._count(name, "timeouts")
+        raise LLMCallTimeout(f"{name}: no response within {timeout:.1f}s")
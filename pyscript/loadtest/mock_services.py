@@ -0,0 +1,303 @@
+import re
+import json
+import math
+import time
+import random
+import argparse
+import threading
+import itertools
+from collections import Counter
+from urllib.parse import urlsplit, parse_qsl, unquote
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-ins for the Gemini REST API (generate + embeddings) and Supabase (PostgREST,
+# RPC and storage), with configurable latency and failure rates. Used by run_load.py; can
+# also be started on its own:
+#
+#   python loadtest/mock_services.py --port 8900 --gemini-latency 800:0.5 --gemini-429-rate 0.02
+#
+# and the backend pointed at it with GEMINI_API_ENDPOINT=http://127.0.0.1:8900 and
+# REACT_APP_SUPABASE_URL=http://127.0.0.1:8900.
+
+# Supabase client libraries reject keys that do not look like a JWT
+MOCK_SUPABASE_KEY = "mock.supabase.key"
+
+PRIMARY_KEYS = {'user_info': 'user_id', 'user_plan_theme': 'user_id', 'resume_text': 'resume_url'}
+
+COURSES = [
+    {'title': 'Machine Learning Specialization', 'rating': 4.9, 'duration': 90, 'course_url': 'https://example.com/ml', 'difficulty': 'Medium'},
+    {'title': 'Python for Everybody', 'rating': 4.8, 'duration': 60, 'course_url': 'https://example.com/python', 'difficulty': 'Easy'},
+    {'title': 'Deep Learning Specialization', 'rating': 4.8, 'duration': 120, 'course_url': 'https://example.com/dl', 'difficulty': 'Hard'},
+]
+
+
+def parse_latency(spec: str):
+    # "median_ms:sigma" for a log-normal distribution, e.g. "800:0.5"
+    median, _, sigma = spec.partition(':')
+    return float(median) / 1000.0, float(sigma or 0)
+
+
+class ServiceProfile:
+    def __init__(self, latency: str, error_rate: float = 0.0, rate_429: float = 0.0):
+        self.median, self.sigma = parse_latency(latency)
+        self.error_rate = error_rate
+        self.rate_429 = rate_429
+
+    def delay(self) -> float:
+        return self.median * math.exp(self.sigma * random.gauss(0, 1))
+
+    def failure(self):
+        roll = random.random()
+        if roll < self.rate_429:
+            return 429, "RESOURCE_EXHAUSTED", "Resource has been exhausted (e.g. check quota)."
+        if roll < self.rate_429 + self.error_rate:
+            return 503, "UNAVAILABLE", "The service is currently unavailable."
+        return None
+
+
+class MockState:
+    def __init__(self, gemini: ServiceProfile, embeddings: ServiceProfile, supabase: ServiceProfile):
+        self.profiles = {'gemini': gemini, 'embeddings': embeddings, 'supabase': supabase}
+        self.lock = threading.Lock()
+        # Random course embeddings: task linking runs its full path but rarely finds a match
+        self.tables = {'courses': [dict(course, embedding=json.dumps([random.uniform(-1, 1) for _ in range(768)])) for course in COURSES]}
+        self.files = {}
+        self.counts = Counter()
+        # Serial primary key for inserted rows that do not carry one
+        self.row_ids = itertools.count(1)
+
+    def seed_users(self, base_url: str, count: int, resume_words: int = 600):
+        words = ("python sql machine learning forecasting pyspark databricks stakeholder dashboards "
+                 "experimentation retail energy leadership mentoring deployment").split()
+        users = []
+        for i in range(count):
+            user_id = f"loadtest-user-{i}"
+            path = f"{user_id}.txt"
+            self.files[('resumes', path)] = " ".join(random.choice(words) for _ in range(resume_words)).encode('utf-8')
+            users.append({
+                'user_id': user_id, 'age': 30, 'field_of_work': 'Data Science', 'current_position': 'Data Scientist',
+                'gender': 'female', 'marital_status': 'single', 'education': 'MSc Statistics', 'work_experience': '6 Years',
+                'resume': f"{base_url}/storage/v1/object/public/resumes/{path}",
+                'q2': 'Become a senior data scientist and lead ML projects end to end.',
+                'q3': 'Limited exposure to production ML and to stakeholder management.',
+                'q4': 'Start a data consultancy.'
+            })
+        with self.lock:
+            self.tables['user_info'] = users
+        return [user['user_id'] for user in users]
+
+
+def _matches(row: dict, filters: list) -> bool:
+    for column, op, value in filters:
+        if op == 'not':
+            op, _, value = value.partition('.')
+            if _matches(row, [(column, op, value)]):
+                return False
+            continue
+        field = row.get(column)
+        if op == 'eq' and str(field) != value:
+            return False
+        if op == 'in' and str(field) not in [v.strip('"') for v in value.strip('()').split(',')]:
+            return False
+        if op in ('lt', 'lte', 'gt', 'gte'):
+            try:
+                left, right = float(field), float(value)
+            except (TypeError, ValueError):
+                return False
+            if not {'lt': left < right, 'lte': left <= right, 'gt': left > right, 'gte': left >= right}[op]:
+                return False
+    return True
+
+
+def make_handler(state: MockState):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _body(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            return json.loads(self.rfile.read(length) or b'null') if length else None
+
+        def _send(self, status, payload=None, raw=None, content_type='application/json'):
+            data = raw if raw is not None else json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _simulate(self, service: str) -> bool:
+            # Sleeps for the service latency; answers with a failure and returns False when one is drawn
+            profile = state.profiles[service]
+            time.sleep(profile.delay())
+            failure = profile.failure()
+            with state.lock:
+                state.counts[f"{service}_requests"] += 1
+                if failure:
+                    state.counts[f"{service}_{failure[0]}"] += 1
+            if failure:
+                code, status, message = failure
+                self._send(code, {"error": {"code": code, "message": message, "status": status}})
+                return False
+            return True
+
+        def do_GET(self):
+            self._dispatch('GET')
+
+        def do_POST(self):
+            self._dispatch('POST')
+
+        def do_PATCH(self):
+            self._dispatch('PATCH')
+
+        def do_DELETE(self):
+            self._dispatch('DELETE')
+
+        def _dispatch(self, method):
+            url = urlsplit(self.path)
+            path = unquote(url.path)
+            try:
+                if path == '/__stats':
+                    with state.lock:
+                        return self._send(200, dict(state.counts))
+                if path.startswith('/v1beta/') or path.startswith('/v1/'):
+                    return self._gemini(path, self._body())
+                if path.startswith('/rest/v1/rpc/'):
+                    return self._rpc(path.rsplit('/', 1)[1])
+                if path.startswith('/rest/v1/'):
+                    return self._table(method, path[len('/rest/v1/'):], parse_qsl(url.query), self._body())
+                if path.startswith('/storage/v1/object/'):
+                    return self._storage(path[len('/storage/v1/object/'):])
+                self._send(404, {"message": f"No mock for {method} {path}"})
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+        def _gemini(self, path, body):
+            if path.endswith(':embedContent') or path.endswith(':batchEmbedContents'):
+                if not self._simulate('embeddings'):
+                    return
+                vector = [random.uniform(-1, 1) for _ in range(768)]
+                if path.endswith(':embedContent'):
+                    return self._send(200, {"embedding": {"values": vector}})
+                return self._send(200, {"embeddings": [{"values": vector} for _ in body.get('requests', [])]})
+
+            if not self._simulate('gemini'):
+                return
+            prompt = json.dumps(body)
+            config = body.get('generationConfig') or body.get('generation_config') or {}
+            if config.get('responseMimeType') == 'application/json' or config.get('response_mime_type') == 'application/json':
+                text = json.dumps({"result": True, "explanation": "The plan aligns with the user's goals."})
+            elif 'Create a plan for month' in prompt:
+                month = re.search(r'Create a plan for month (\d+)', prompt).group(1)
+                text = f"Theme: Month {month} focus on applied machine learning\n\nTasks:\n" + "\n\n".join(
+                    f"{i}. **Task {i} for month {month}**\nComplete a concrete milestone towards the 1-year goal.\n(Expected time frame: {i} weeks)"
+                    for i in range(1, 5))
+            else:
+                text = "Here are a few courses that fit your goals:\n1. [Machine Learning Specialization](https://example.com/ml)"
+            self._send(200, {
+                "candidates": [{"content": {"parts": [{"text": text}], "role": "model"}, "finishReason": "STOP", "index": 0}],
+                "usageMetadata": {"promptTokenCount": len(prompt) // 4, "candidatesTokenCount": len(text) // 4,
+                                  "totalTokenCount": (len(prompt) + len(text)) // 4}
+            })
+
+        def _rpc(self, name):
+            if not self._simulate('supabase'):
+                return
+            if name == 'match_courses':
+                return self._send(200, COURSES)
+            self._send(404, {"message": f"Unknown function {name}"})
+
+        def _table(self, method, table, query, body):
+            if not self._simulate('supabase'):
+                return
+            filters = []
+            on_conflict = None
+            for key, value in query:
+                if key == 'on_conflict':
+                    on_conflict = value
+                elif key not in ('select', 'order', 'limit', 'offset', 'columns'):
+                    op, _, operand = value.partition('.')
+                    filters.append((key, op, operand))
+
+            with state.lock:
+                rows = state.tables.setdefault(table, [])
+                if method == 'GET':
+                    result = [row for row in rows if _matches(row, filters)]
+                elif method == 'POST':
+                    new_rows = body if isinstance(body, list) else [body]
+                    key = on_conflict or PRIMARY_KEYS.get(table)
+                    if 'merge-duplicates' in (self.headers.get('Prefer') or '') and key:
+                        incoming = {row.get(key) for row in new_rows}
+                        rows[:] = [row for row in rows if row.get(key) not in incoming]
+                    new_rows = [row if 'id' in row or table in PRIMARY_KEYS else dict(row, id=next(state.row_ids)) for row in new_rows]
+                    rows.extend(dict(row) for row in new_rows)
+                    result = new_rows
+                elif method == 'PATCH':
+                    result = [row for row in rows if _matches(row, filters)]
+                    for row in result:
+                        row.update(body)
+                else:
+                    result = [row for row in rows if _matches(row, filters)]
+                    rows[:] = [row for row in rows if not _matches(row, filters)]
+            self._send(201 if method == 'POST' else 200, result)
+
+        def _storage(self, object_path):
+            if not self._simulate('supabase'):
+                return
+            if object_path.startswith('public/'):
+                object_path = object_path[len('public/'):]
+            bucket, _, path = object_path.partition('/')
+            data = state.files.get((bucket, path))
+            if data is None:
+                return self._send(404, {"message": "Object not found"})
+            self._send(200, raw=data, content_type='application/octet-stream')
+
+    return Handler
+
+
+def start_mock_services(port: int, state: MockState) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def add_profile_arguments(parser):
+    parser.add_argument('--gemini-latency', default='800:0.5', help="Gemini generate latency, median_ms:sigma (log-normal)")
+    parser.add_argument('--gemini-error-rate', type=float, default=0.0, help="Fraction of Gemini calls answered with 503")
+    parser.add_argument('--gemini-429-rate', type=float, default=0.0, help="Fraction of Gemini calls answered with 429")
+    parser.add_argument('--embedding-latency', default='80:0.3', help="Embedding latency, median_ms:sigma")
+    parser.add_argument('--supabase-latency', default='20:0.3', help="Supabase REST/RPC/storage latency, median_ms:sigma")
+    parser.add_argument('--supabase-error-rate', type=float, default=0.0, help="Fraction of Supabase calls answered with 503")
+
+
+def state_from_arguments(args) -> MockState:
+    return MockState(
+        gemini=ServiceProfile(args.gemini_latency, args.gemini_error_rate, args.gemini_429_rate),
+        embeddings=ServiceProfile(args.embedding_latency, args.gemini_error_rate, args.gemini_429_rate),
+        supabase=ServiceProfile(args.supabase_latency, args.supabase_error_rate)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock Gemini and Supabase services for load tests.")
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--users', type=int, default=100, help="Users seeded into user_info")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    state = state_from_arguments(args)
+    state.seed_users(f"http://127.0.0.1:{args.port}", args.users)
+    server = start_mock_services(args.port, state)
+    print(f"Mock services listening on http://127.0.0.1:{args.port} with {args.users} users")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,365 @@
+import os
+import sys
+import json
+import math
+import time
+import random
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from mock_services import MOCK_SUPABASE_KEY, add_profile_arguments, state_from_arguments, start_mock_services
+
+# Load and soak test for the backend against local mock Gemini/Supabase services.
+#
+#   cd pyscript
+#   python loadtest/run_load.py --workers 4 --chat-rps 5 --plan-rps 0.1 --duration 300
+#   python loadtest/run_load.py --workers 8 --worker-class gthread --threads 4 --chat-rps 20 --duration 3600 --report soak.json
+#   python loadtest/run_load.py --server uvicorn --chat-rps 50 --plan-rps 1 --duration 300
+#
+# Requests arrive open-loop (Poisson) at the target rates, so an overloaded server shows up
+# as growing latency and in-flight requests rather than as a lower offered load. The report
+# gives throughput, p50/p95/p99 latency per endpoint, worker saturation, server memory
+# growth, and the worker count needed for the target rates (Little's law).
+
+PYSCRIPT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHAT_MESSAGES = [
+    "What are the best courses for machine learning beginners?",
+    "How do I prepare for a senior data scientist interview?",
+    "Which certifications help with cloud data engineering?",
+    "How can I get better at stakeholder management?",
+    "What should I learn to move into MLOps?",
+]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(math.ceil(q / 100.0 * len(ordered))) - 1)]
+
+
+def process_rss_kb(pid: int) -> int:
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def process_tree(pid: int):
+    pids = [pid]
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            children = [int(child) for child in f.read().split()]
+    except OSError:
+        children = []
+    for child in children:
+        pids.extend(process_tree(child))
+    return pids
+
+
+class Recorder:
+    """Collects request results and integrates in-flight requests over time."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        self.results = []
+        self.in_flight = 0
+        self.last_change = time.monotonic()
+        self.in_flight_seconds = 0.0
+        self.busy_seconds = 0.0
+        self.all_busy_seconds = 0.0
+
+    def _advance(self, now):
+        elapsed = now - self.last_change
+        self.in_flight_seconds += elapsed * self.in_flight
+        self.busy_seconds += elapsed * min(self.in_flight, self.capacity)
+        if self.in_flight >= self.capacity:
+            self.all_busy_seconds += elapsed
+        self.last_change = now
+
+    def started(self):
+        with self.lock:
+            self._advance(time.monotonic())
+            self.in_flight += 1
+
+    def finished(self, endpoint, started_at, latency, status):
+        with self.lock:
+            self._advance(time.monotonic())
+            self.in_flight -= 1
+            self.results.append((endpoint, started_at, latency, status))
+
+    def snapshot(self):
+        with self.lock:
+            self._advance(time.monotonic())
+            return {
+                "in_flight": self.in_flight,
+                "in_flight_seconds": self.in_flight_seconds,
+                "busy_seconds": self.busy_seconds,
+                "all_busy_seconds": self.all_busy_seconds,
+                "completed": len(self.results)
+            }
+
+
+def send(base_url, endpoint, payload, timeout):
+    request = urllib.request.Request(f"{base_url}{endpoint}", data=json.dumps(payload).encode('utf-8'),
+                                     headers={'Content-Type': 'application/json'}, method='POST')
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except Exception:
+        # Connection refused/reset or client timeout
+        return 0
+
+
+def fire(recorder, base_url, endpoint, payload, timeout, start_time):
+    recorder.started()
+    started = time.monotonic()
+    status = send(base_url, endpoint, payload, timeout)
+    recorder.finished(endpoint, started - start_time, time.monotonic() - started, status)
+
+
+def arrivals(rate, duration, start_time, stop, submit):
+    # Poisson arrivals at `rate` per second until the duration is over
+    if rate <= 0:
+        return
+    next_at = start_time + random.expovariate(rate)
+    while not stop.is_set() and next_at < start_time + duration:
+        delay = next_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        submit()
+        next_at += random.expovariate(rate)
+
+
+def start_server(args, mock_url, port, work_dir):
+    env = dict(os.environ,
+               REACT_APP_SUPABASE_URL=mock_url,
+               SUPABASE_SECRET_KEY=MOCK_SUPABASE_KEY,
+               GOOGLE_API_KEY="mock-key",
+               GEMINI_API_ENDPOINT=mock_url,
+               CHAT_WEB_SEARCH="0",
+               PROMPT_CACHE="none",
+               # The mock tables have no schema, so the production path with course linking is load tested
+               COURSE_LINKING="1",
+               GEMINI_RATE_DB=os.path.join(work_dir, "rate.db"),
+               SINGLEFLIGHT_DB=os.path.join(work_dir, "singleflight.db"),
+               PLAN_CHECKPOINT_DB=os.path.join(work_dir, "checkpoints.db"))
+    if args.server == 'uvicorn':
+        command = [sys.executable, '-m', 'uvicorn', '--app-dir', PYSCRIPT_DIR, 'asgi:app',
+                   '--host', '127.0.0.1', '--port', str(port), '--workers', str(args.workers), '--log-level', 'warning']
+    else:
+        command = [sys.executable, '-m', 'gunicorn', '--chdir', PYSCRIPT_DIR, 'app:app',
+                   '--bind', f'127.0.0.1:{port}', '--workers', str(args.workers),
+                   '--worker-class', args.worker_class, '--threads', str(args.threads),
+                   '--timeout', str(args.request_timeout), '--log-level', 'warning']
+    process = subprocess.Popen(command, env=env, cwd=PYSCRIPT_DIR)
+
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/llm_stats", timeout=2):
+                return process
+        except Exception:
+            time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError("Server did not become ready within 120 seconds")
+
+
+def summarize(results, duration):
+    by_endpoint = {}
+    for endpoint, _, latency, status in results:
+        by_endpoint.setdefault(endpoint, []).append((latency, status))
+
+    summary = {}
+    for endpoint, items in by_endpoint.items():
+        ok = [latency for latency, status in items if 200 <= status < 300]
+        statuses = {}
+        for _, status in items:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        summary[endpoint] = {
+            "requests": len(items),
+            "ok": len(ok),
+            "error_rate": round(1 - len(ok) / len(items), 4),
+            "statuses": statuses,
+            "throughput_rps": round(len(ok) / duration, 3),
+            "mean_s": round(sum(ok) / len(ok), 3) if ok else None,
+            "p50_s": round(percentile(ok, 50), 3) if ok else None,
+            "p95_s": round(percentile(ok, 95), 3) if ok else None,
+            "p99_s": round(percentile(ok, 99), 3) if ok else None,
+        }
+    return summary
+
+
+def linear_slope(points):
+    # Least-squares slope of (seconds, value) points
+    if len(points) < 2:
+        return 0.0
+    n = len(points)
+    mean_x = sum(x for x, _ in points) / n
+    mean_y = sum(y for _, y in points) / n
+    var_x = sum((x - mean_x) ** 2 for x, _ in points)
+    if var_x == 0:
+        return 0.0
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / var_x
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load/soak test the backend against mock Gemini and Supabase services.")
+    parser.add_argument('--target', help="Base URL of an already running backend (default: start one against the mocks)")
+    parser.add_argument('--server', choices=['gunicorn', 'uvicorn'], default='gunicorn', help="Server started when --target is not given")
+    parser.add_argument('--workers', type=int, default=4, help="Server worker processes")
+    parser.add_argument('--worker-class', default='sync', help="Gunicorn worker class (sync, gthread, ...)")
+    parser.add_argument('--threads', type=int, default=1, help="Threads per gunicorn worker (gthread)")
+    parser.add_argument('--chat-rps', type=float, default=2.0, help="Target /api/chat requests per second")
+    parser.add_argument('--plan-rps', type=float, default=0.05, help="Target /generate_plan requests per second")
+    parser.add_argument('--duration', type=float, default=120, help="Seconds of traffic")
+    parser.add_argument('--sample-interval', type=float, default=5, help="Seconds between time-series samples")
+    parser.add_argument('--request-timeout', type=float, default=900, help="Client timeout per request")
+    parser.add_argument('--users', type=int, default=1000, help="Users seeded into the mock user_info table")
+    parser.add_argument('--target-utilization', type=float, default=0.7, help="Worker utilisation used for the capacity estimate")
+    parser.add_argument('--mock-port', type=int, help="Port of the mock services (default: a free port)")
+    parser.add_argument('--report', help="Write the JSON report to this file")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    mock_port = args.mock_port or free_port()
+    mock_url = f"http://127.0.0.1:{mock_port}"
+    mock_state = state_from_arguments(args)
+    user_ids = mock_state.seed_users(mock_url, args.users)
+    mock_server = start_mock_services(mock_port, mock_state)
+
+    server = None
+    work_dir = tempfile.mkdtemp(prefix="athena_loadtest_")
+    if args.target:
+        base_url = args.target.rstrip('/')
+    else:
+        port = free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        print(f"Starting {args.server} with {args.workers} worker(s) against mocks at {mock_url}...")
+        server = start_server(args, mock_url, port, work_dir)
+
+    # Requests a sync server can serve at once; beyond this they queue in the listen backlog
+    capacity = args.workers * (args.threads if args.worker_class == 'gthread' else 1)
+    if args.server == 'uvicorn' and not args.target:
+        capacity = 10 ** 6
+    recorder = Recorder(capacity)
+    stop = threading.Event()
+    user_cycle = iter(range(10 ** 9))
+    executor = ThreadPoolExecutor(max_workers=4096)
+    start_time = time.monotonic()
+
+    def submit_chat():
+        payload = {"message": random.choice(CHAT_MESSAGES), "conversation_history": [],
+                   "session_id": f"loadtest-{random.randrange(10 ** 6)}"}
+        payload["conversation_history"].append({"role": "user", "content": payload["message"]})
+        executor.submit(fire, recorder, base_url, '/api/chat', payload, args.request_timeout, start_time)
+
+    def submit_plan():
+        # A fresh user each time, so single-flight does not collapse the requests
+        user_id = user_ids[next(user_cycle) % len(user_ids)]
+        payload = {"user_id": user_id, "plan_run_id": f"loadtest-{time.time_ns()}"}
+        executor.submit(fire, recorder, base_url, '/generate_plan', payload, args.request_timeout, start_time)
+
+    generators = [threading.Thread(target=arrivals, args=(args.chat_rps, args.duration, start_time, stop, submit_chat), daemon=True),
+                  threading.Thread(target=arrivals, args=(args.plan_rps, args.duration, start_time, stop, submit_plan), daemon=True)]
+    for generator in generators:
+        generator.start()
+
+    samples = []
+    previous = recorder.snapshot()
+    previous_at = time.monotonic()
+    print(f"Driving {args.chat_rps} chat/s and {args.plan_rps} plan/s against {base_url} for {args.duration:.0f}s")
+    try:
+        while any(generator.is_alive() for generator in generators) or recorder.snapshot()["in_flight"]:
+            time.sleep(args.sample_interval)
+            now = time.monotonic()
+            current = recorder.snapshot()
+            interval = now - previous_at
+            sample = {
+                "t": round(now - start_time, 1),
+                "in_flight": current["in_flight"],
+                "completed_rps": round((current["completed"] - previous["completed"]) / interval, 3),
+                "mean_in_flight": round((current["in_flight_seconds"] - previous["in_flight_seconds"]) / interval, 2),
+                "saturation": round((current["busy_seconds"] - previous["busy_seconds"]) / interval / capacity, 3),
+                "server_rss_mb": round(sum(process_rss_kb(pid) for pid in process_tree(server.pid)) / 1024, 1) if server else None,
+            }
+            samples.append(sample)
+            print(f"  t={sample['t']:>7}s in_flight={sample['in_flight']:>4} done/s={sample['completed_rps']:>7} "
+                  f"saturation={sample['saturation']:>5} rss={sample['server_rss_mb']} MB")
+            previous, previous_at = current, now
+    except KeyboardInterrupt:
+        stop.set()
+        print("Interrupted; reporting the requests completed so far")
+
+    elapsed = time.monotonic() - start_time
+    executor.shutdown(wait=False, cancel_futures=True)
+    final = recorder.snapshot()
+    endpoints = summarize(recorder.results, min(elapsed, args.duration))
+
+    # Little's law: worker-seconds per request = mean latency for a sync worker, so the busy
+    # workers needed at the target rates is sum(rate x mean latency), plus headroom
+    target_rates = {'/api/chat': args.chat_rps, '/generate_plan': args.plan_rps}
+    busy_at_target = sum(rate * (endpoints.get(endpoint, {}).get("mean_s") or 0) for endpoint, rate in target_rates.items())
+    rss_points = [(sample["t"], sample["server_rss_mb"]) for sample in samples if sample["server_rss_mb"]]
+    report = {
+        "config": {key: value for key, value in vars(args).items() if key != 'report'},
+        "duration_s": round(elapsed, 1),
+        "endpoints": endpoints,
+        "saturation": {
+            "capacity": capacity if capacity < 10 ** 6 else None,
+            "mean_in_flight": round(final["in_flight_seconds"] / elapsed, 2),
+            "mean_utilization": round(final["busy_seconds"] / elapsed / capacity, 3),
+            "all_workers_busy_fraction": round(final["all_busy_seconds"] / elapsed, 3),
+        },
+        "memory": {
+            "start_mb": rss_points[0][1] if rss_points else None,
+            "end_mb": rss_points[-1][1] if rss_points else None,
+            "max_mb": max(value for _, value in rss_points) if rss_points else None,
+            "growth_mb_per_hour": round(linear_slope(rss_points) * 3600, 1) if rss_points else None,
+        },
+        "capacity": {
+            "worker_seconds_per_request": {endpoint: stats["mean_s"] for endpoint, stats in endpoints.items()},
+            "busy_workers_at_target_rates": round(busy_at_target, 2),
+            "workers_needed": math.ceil(busy_at_target / args.target_utilization) if busy_at_target else None,
+            "target_utilization": args.target_utilization,
+        },
+        "mock_services": mock_state.counts,
+        "timeseries": samples,
+    }
+
+    print(json.dumps({key: value for key, value in report.items() if key not in ('timeseries', 'config')}, indent=2))
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.report}")
+
+    if server:
+        server.terminate()
+        server.wait(timeout=30)
+    mock_server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,2 @@
+-- Course links of each generated task (course_linking.py). Apply before setting COURSE_LINKING=1.
+alter table user_plan_taskoutline add column if not exists course_links jsonb;
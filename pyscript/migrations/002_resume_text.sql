@@ -0,0 +1,7 @@
+-- Extracted resume text (resume_extraction.py). Until it exists, resumes are parsed on every plan request.
+create table if not exists resume_text (
+    resume_url text primary key,
+    content text not null,
+    content_hash text not null,
+    extracted_at timestamptz not null
+);
@@ -0,0 +1,165 @@
+import os
+import json
+import time
+import random
+import asyncio
+import threading
+from collections import deque, Counter
+from typing import Any, Callable, Dict, Optional
+
+# Quality tiers, lowest first. A node may use any model at or above its tier.
+TIERS = ("basic", "standard", "high")
+
+MODEL_TIERS = {
+    "gemini-1.5-flash-8b-001": "basic",
+    "gemini-1.5-flash-001": "standard",
+    "gemini-1.5-flash-002": "standard",
+    "gemini-1.5-pro-002": "high",
+}
+
+# Per graph node: minimum tier, p95 latency SLO in seconds, candidate models and the model
+# used until there are measurements. Fixed model versions only, since context caching needs them.
+NODE_ROUTES = {
+    "planner": {"tier": "standard", "slo": 30.0, "default": "gemini-1.5-flash-001",
+                "models": ["gemini-1.5-flash-001", "gemini-1.5-flash-002"]},
+    "checker": {"tier": "basic", "slo": 8.0, "default": "gemini-1.5-flash-8b-001",
+                "models": ["gemini-1.5-flash-8b-001", "gemini-1.5-flash-001", "gemini-1.5-flash-002"]},
+    "chat_answer": {"tier": "standard", "slo": 10.0, "default": "gemini-1.5-flash-001",
+                    "models": ["gemini-1.5-flash-001", "gemini-1.5-flash-002"]},
+}
+
+
+def load_routes() -> Dict[str, dict]:
+    # MODEL_ROUTES='{"checker": {"slo": 5}, "chat_answer": {"models": [...]}}' overrides per node
+    routes = {node: dict(route) for node, route in NODE_ROUTES.items()}
+    overrides = os.getenv("MODEL_ROUTES")
+    if overrides:
+        for node, route in json.loads(overrides).items():
+            routes[node] = dict(routes.get(node, NODE_ROUTES["planner"]), **route)
+    return routes
+
+
+class ModelRouter:
+    """Picks the model for each LLM call of a graph node.
+
+    Latency and errors are tracked per (node, model) over a sliding time window. A call
+    goes to the fastest (median) candidate whose p95 meets the node's SLO and whose error
+    rate is acceptable. Without enough recent samples a node uses its default model, and
+    unmeasured candidates are probed now and then so a degraded default can be replaced."""
+
+    def __init__(self, routes: Optional[Dict[str, dict]] = None, window_seconds: Optional[float] = None,
+                 min_samples: int = 5, max_error_rate: Optional[float] = None, explore_rate: Optional[float] = None):
+        self.routes = routes or load_routes()
+        self.window_seconds = window_seconds if window_seconds is not None else float(os.getenv("MODEL_ROUTER_WINDOW", 300))
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate if max_error_rate is not None else float(os.getenv("MODEL_ROUTER_MAX_ERROR_RATE", 0.2))
+        self.explore_rate = explore_rate if explore_rate is not None else float(os.getenv("MODEL_ROUTER_EXPLORE", 0.05))
+        self._lock = threading.Lock()
+        # (node, model) -> deque of (timestamp, latency, ok)
+        self._samples: Dict[tuple, deque] = {}
+        self._chosen = Counter()
+
+    def candidates(self, node: str):
+        route = self.routes[node]
+        minimum = TIERS.index(route["tier"])
+        return [model for model in route["models"] if TIERS.index(MODEL_TIERS.get(model, "standard")) >= minimum]
+
+    def _summary_locked(self, node: str, model: str, now: float) -> Optional[dict]:
+        samples = self._samples.get((node, model))
+        if not samples:
+            return None
+        while samples and now - samples[0][0] > self.window_seconds:
+            samples.popleft()
+        if len(samples) < self.min_samples:
+            return None
+        latencies = sorted(latency for _, latency, ok in samples if ok)
+        errors = sum(1 for _, _, ok in samples if not ok)
+        return {
+            "samples": len(samples),
+            "p50": latencies[len(latencies) // 2] if latencies else float("inf"),
+            "p95": latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))] if latencies else float("inf"),
+            "error_rate": errors / len(samples)
+        }
+
+    def choose(self, node: str) -> str:
+        route = self.routes[node]
+        candidates = self.candidates(node)
+        now = time.time()
+        with self._lock:
+            summaries = {model: self._summary_locked(node, model, now) for model in candidates}
+
+        unmeasured = [model for model in candidates if summaries[model] is None]
+        healthy = [model for model in candidates if summaries[model] is not None
+                   and summaries[model]["p95"] <= route["slo"] and summaries[model]["error_rate"] <= self.max_error_rate]
+
+        if unmeasured and random.random() < self.explore_rate:
+            model = random.choice(unmeasured)
+        elif healthy:
+            model = min(healthy, key=lambda m: summaries[m]["p50"])
+        elif route["default"] in unmeasured:
+            model = route["default"]
+        elif unmeasured:
+            # Every measured model misses the SLO; try one we know nothing recent about
+            model = unmeasured[0]
+        else:
+            # Nothing meets the SLO: the least bad model, errors first, then tail latency
+            model = min(candidates, key=lambda m: (summaries[m]["error_rate"] > self.max_error_rate, summaries[m]["p95"]))
+
+        with self._lock:
+            self._chosen[(node, model)] += 1
+        return model
+
+    def record(self, node: str, model: str, latency: float, ok: bool):
+        with self._lock:
+            self._samples.setdefault((node, model), deque(maxlen=500)).append((time.time(), latency, ok))
+
+    def attempt(self, node: str, invoke: Callable[[str], Any]) -> Callable[[], Any]:
+        # One routed attempt per call, so every LLMCaller retry picks the model again
+        def run():
+            model = self.choose(node)
+            start = time.monotonic()
+            try:
+                result = invoke(model)
+            except Exception:
+                self.record(node, model, time.monotonic() - start, ok=False)
+                raise
+            self.record(node, model, time.monotonic() - start, ok=True)
+            return result
+        return run
+
+    def aattempt(self, node: str, ainvoke: Callable[[str], Any]) -> Callable[[], Any]:
+        async def run():
+            model = self.choose(node)
+            start = time.monotonic()
+            try:
+                result = await ainvoke(model)
+            except asyncio.CancelledError:
+                # Cancelled by LLMCaller after a timeout or a faster hedge; only a slow call says something
+                elapsed = time.monotonic() - start
+                if elapsed > self.routes[node]["slo"]:
+                    self.record(node, model, elapsed, ok=True)
+                raise
+            except Exception:
+                self.record(node, model, time.monotonic() - start, ok=False)
+                raise
+            self.record(node, model, time.monotonic() - start, ok=True)
+            return result
+        return run
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        now = time.time()
+        report = {}
+        with self._lock:
+            for node, route in self.routes.items():
+                models = {}
+                for model in route["models"]:
+                    summary = self._summary_locked(node, model, now)
+                    models[model] = {
+                        "chosen": self._chosen[(node, model)],
+                        "samples": summary["samples"] if summary else len(self._samples.get((node, model), ())),
+                        "p50_seconds": round(summary["p50"], 3) if summary and summary["p50"] != float("inf") else None,
+                        "p95_seconds": round(summary["p95"], 3) if summary and summary["p95"] != float("inf") else None,
+                        "error_rate": round(summary["error_rate"], 3) if summary else None,
+                    }
+                report[node] = {"tier": route["tier"], "slo_seconds": route["slo"], "models": models}
+        return report
@@ -0,0 +1,196 @@
+import os
+import re
+import zlib
+import threading
+from typing import Dict, List, Optional
+import numpy as np
+
+# Minimal stop list so shingles are built from the words that carry meaning
+_STOPWORDS = set("""a an and are as at be by for from has have how in into is it its of on or that the this
+to was were will with your you their them they our we can should week weeks month months""".split())
+
+# At least one task has to teach something new (guideline in the planner prompt)
+_LEARNING_WORDS = {
+    "course", "courses", "certification", "certificate", "book", "books", "read", "tutorial", "tutorials",
+    "workshop", "workshops", "training", "bootcamp", "specialization", "class", "lecture", "lectures",
+    "webinar", "mooc", "learn", "study", "coursera", "udemy", "edx", "udacity", "datacamp", "pluralsight",
+}
+# Tasks that may or may not involve new learning; left to the LLM checker
+_MAYBE_LEARNING_WORDS = {"project", "practice", "explore", "research", "skill", "skills", "hands-on", "exercise"}
+
+_TIME_FRAME = re.compile(r"\(Expected time frame:\s*(.*?)\)", re.IGNORECASE)
+_UNIT_WEEKS = {"day": 1 / 7, "week": 1.0, "month": 4.35}
+
+_PRIME = (1 << 31) - 1
+_NUM_PERM = 128
+_rng = np.random.RandomState(20240901)
+# Fixed seeds: the same text always gets the same signature, in every process
+_PERM_A = _rng.randint(1, _PRIME, size=_NUM_PERM).astype(np.uint64)
+_PERM_B = _rng.randint(0, _PRIME, size=_NUM_PERM).astype(np.uint64)
+
+
+def words(text: str) -> List[str]:
+    text = _TIME_FRAME.sub(" ", text.lower().replace("**", " "))
+    return [word for word in re.findall(r"[a-z0-9][a-z0-9+#-]*", text) if word not in _STOPWORDS]
+
+
+def shingles(text: str, k: int = 2) -> set:
+    tokens = words(text)
+    if len(tokens) < k:
+        return {" ".join(tokens)} if tokens else set()
+    return {" ".join(tokens[i:i + k]) for i in range(len(tokens) - k + 1)}
+
+
+def minhash(shingle_set: set) -> Optional[np.ndarray]:
+    if not shingle_set:
+        return None
+    hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) % _PRIME for s in shingle_set), dtype=np.uint64, count=len(shingle_set))
+    return ((_PERM_A[:, None] * hashes[None, :] + _PERM_B[:, None]) % _PRIME).min(axis=1)
+
+
+def estimated_jaccard(left: Optional[np.ndarray], right: Optional[np.ndarray]) -> float:
+    if left is None or right is None:
+        return 0.0
+    return float(np.count_nonzero(left == right)) / _NUM_PERM
+
+
+def max_similarity(signature: Optional[np.ndarray], others: List[Optional[np.ndarray]]) -> float:
+    # Highest estimated Jaccard similarity against many signatures at once
+    others = [other for other in others if other is not None]
+    if signature is None or not others:
+        return 0.0
+    return float((np.vstack(others) == signature).mean(axis=1).max())
+
+
+def time_frame_weeks(task: str) -> Optional[float]:
+    # Upper end of "(Expected time frame: 1-2 weeks)" in weeks; None if missing or unreadable
+    match = _TIME_FRAME.search(task)
+    if not match:
+        return None
+    text = match.group(1).lower()
+    unit = next((unit for unit in _UNIT_WEEKS if unit in text), None)
+    numbers = [float(n) for n in re.findall(r"\d+(?:\.\d+)?", text)]
+    if unit is None or not numbers:
+        return None
+    return max(numbers) * _UNIT_WEEKS[unit]
+
+
+class RuleVerdict:
+    def __init__(self, result: Optional[bool], issues: List[str], doubts: List[str]):
+        # result is None when the rules cannot decide and the LLM checker should
+        self.result = result
+        self.issues = issues
+        self.doubts = doubts
+
+    @property
+    def conclusive(self) -> bool:
+        return self.result is not None
+
+    def explanation(self) -> str:
+        if self.result:
+            return "Local checks passed: distinct theme and tasks, 3-5 tasks with time frames, includes a learning task."
+        return "Local checks failed: " + "; ".join(self.issues)
+
+
+class PlanRuleChecker:
+    """Deterministic checks of one month's plan against the planner guidelines and the
+    previous months: theme and task repetition (MinHash over word shingles), task count,
+    expected time frames and the presence of a learning task.
+
+    Structural violations fail the month outright. Borderline similarity, an unclear
+    learning task or a month with no overlap with the user's goal are inconclusive and
+    go to the LLM checker."""
+
+    def __init__(self, duplicate_threshold: Optional[float] = None, similar_threshold: Optional[float] = None,
+                 min_tasks: int = 3, max_tasks: int = 5, max_weeks: float = 4.5):
+        self.duplicate_threshold = duplicate_threshold if duplicate_threshold is not None else float(os.getenv("PLAN_CHECK_DUPLICATE", 0.7))
+        self.similar_threshold = similar_threshold if similar_threshold is not None else float(os.getenv("PLAN_CHECK_SIMILAR", 0.45))
+        self.min_tasks = min_tasks
+        self.max_tasks = max_tasks
+        self.max_weeks = max_weeks
+        self._lock = threading.Lock()
+        self._signatures: Dict[str, Optional[np.ndarray]] = {}
+        self._counts = {"local_pass": 0, "local_fail": 0, "deferred": 0}
+
+    def signature(self, text: str, k: int = 2) -> Optional[np.ndarray]:
+        # Previous months are compared again every month, so their signatures are kept
+        key = f"{k}:{text}"
+        with self._lock:
+            if key in self._signatures:
+                return self._signatures[key]
+        signature = minhash(shingles(text, k))
+        with self._lock:
+            if len(self._signatures) > 10000:
+                self._signatures.clear()
+            self._signatures[key] = signature
+        return signature
+
+    def check(self, plan: dict, month: int, user_info: dict) -> RuleVerdict:
+        month_plan = plan.get(f"month_{month}") or {}
+        theme = (month_plan.get("theme") or "").strip()
+        tasks = [task["content"] for task in month_plan.get("tasks", [])]
+        previous = [plan[key] for key in plan if key != f"month_{month}" and plan[key]]
+        issues, doubts = [], []
+
+        if not theme or theme == "No theme specified":
+            issues.append("no theme specified")
+        else:
+            # Themes are short, so single words are compared
+            theme_signature = self.signature(theme, k=1)
+            for other in previous:
+                similarity = estimated_jaccard(theme_signature, self.signature(other.get("theme", ""), k=1))
+                if similarity >= 0.8:
+                    issues.append(f"theme repeats an earlier month ('{other.get('theme')}')")
+                    break
+                if similarity >= 0.5:
+                    doubts.append("theme is close to an earlier month's")
+
+        # Tasks without an expected time frame are dropped when the month is parsed, so they show up here
+        if not self.min_tasks <= len(tasks) <= self.max_tasks:
+            issues.append(f"{len(tasks)} tasks with an expected time frame (expected {self.min_tasks}-{self.max_tasks})")
+
+        for index, task in enumerate(tasks, start=1):
+            weeks = time_frame_weeks(task)
+            if weeks is None:
+                doubts.append(f"task {index} has an unreadable time frame")
+            elif weeks > self.max_weeks:
+                issues.append(f"task {index} takes longer than 4 weeks")
+
+        signatures = [self.signature(task) for task in tasks]
+        earlier = [self.signature(task["content"]) for other in previous for task in other.get("tasks", [])]
+        for index, signature in enumerate(signatures, start=1):
+            best = max_similarity(signature, earlier + signatures[:index - 1])
+            if best >= self.duplicate_threshold:
+                issues.append(f"task {index} duplicates an earlier task")
+            elif best >= self.similar_threshold:
+                doubts.append(f"task {index} is similar to an earlier task")
+
+        task_words = [set(words(task)) for task in tasks]
+        if not any(_LEARNING_WORDS & task_word_set for task_word_set in task_words):
+            if any(_MAYBE_LEARNING_WORDS & task_word_set for task_word_set in task_words):
+                doubts.append("no explicit learning task")
+            else:
+                issues.append("no task provides new learning or skill development")
+
+        # Alignment with the goal is the LLM checker's job; the rules only notice a month that
+        # shares no words at all with the user's goal and challenges
+        goal_stems = {word[:6] for word in words(f"{user_info.get('q2', '')} {user_info.get('q3', '')}") if len(word) > 3}
+        month_stems = {word[:6] for word in words(theme + " " + " ".join(tasks))}
+        if goal_stems and not goal_stems & month_stems:
+            doubts.append("no overlap with the user's goal or challenges")
+
+        if issues:
+            verdict = RuleVerdict(False, issues, doubts)
+        elif doubts:
+            verdict = RuleVerdict(None, issues, doubts)
+        else:
+            verdict = RuleVerdict(True, issues, doubts)
+
+        with self._lock:
+            self._counts["deferred" if verdict.result is None else "local_pass" if verdict.result else "local_fail"] += 1
+        return verdict
+
+    def stats(self) -> dict:
+        with self._lock:
+            checks = sum(self._counts.values())
+            return dict(self._counts, llm_call_rate=round(self._counts["deferred"] / checks, 3) if checks else 0.0)
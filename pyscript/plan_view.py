@@ -0,0 +1,137 @@
+import os
+import gzip
+import time
+import sqlite3
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+import orjson
+from course_linking import course_linking_enabled
+
+# Columns the dashboard renders; user_id and bookkeeping columns are not sent per task.
+# course_links only exists once migrations/001_course_links.sql has been applied.
+TASK_COLUMNS = 'id,month,task_number,task_outline,status'
+
+
+class PlanView:
+    # One user's dashboard payload, serialized and compressed once per build
+    def __init__(self, body: bytes, version: int):
+        self.body = body
+        self.gzip_body = gzip.compress(body, compresslevel=6)
+        self.etag = '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+        self.version = version
+        self.built_at = time.time()
+
+
+class PlanViewCache:
+    """In-process cache of the aggregated /plan/<user_id> payload (themes, tasks and goal).
+
+    Every write to a user's plan bumps a per-user version in a SQLite file shared by the
+    workers on the host, so an update served by one worker invalidates the copies cached
+    by the others. The TTL bounds staleness for writes made outside the backend."""
+
+    def __init__(self, conn, ttl_seconds: Optional[float] = None, max_entries: Optional[int] = None,
+                 db_path: Optional[str] = None):
+        self.conn = conn
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.getenv("PLAN_CACHE_TTL", 300))
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv("PLAN_CACHE_SIZE", 2000))
+        self.db_path = db_path or os.getenv("PLAN_CACHE_DB", os.path.join(tempfile.gettempdir(), "athena_plan_versions.db"))
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._local = threading.local()
+        self._executor = ThreadPoolExecutor(max_workers=3)
+        self.task_columns = TASK_COLUMNS + (',course_links' if course_linking_enabled() else '')
+        self._hits = 0
+        self._misses = 0
+        self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self):
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS plan_versions (user_id TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+
+    def _version(self, user_id: str) -> int:
+        row = self._connect().execute("SELECT version FROM plan_versions WHERE user_id = ?", (user_id,)).fetchone()
+        return row[0] if row else 0
+
+    def invalidate(self, user_id: str):
+        # Call after every write to the user's themes or tasks
+        self._connect().execute("""INSERT INTO plan_versions (user_id, version) VALUES (?, 1)
+            ON CONFLICT(user_id) DO UPDATE SET version = version + 1""", (user_id,))
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def get(self, user_id: str) -> Optional[PlanView]:
+        # None when the user has no plan yet
+        version = self._version(user_id)
+        with self._lock:
+            view = self._entries.get(user_id)
+            if view is not None and view.version == version and time.time() - view.built_at < self.ttl_seconds:
+                self._entries.move_to_end(user_id)
+                self._hits += 1
+                return view
+            self._misses += 1
+
+        view = self._build(user_id, version)
+        if view is not None:
+            with self._lock:
+                self._entries[user_id] = view
+                self._entries.move_to_end(user_id)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return view
+
+    def _build(self, user_id: str, version: int) -> Optional[PlanView]:
+        themes = self._executor.submit(lambda: self.conn.table('user_plan_theme').select('*').eq('user_id', user_id).execute())
+        tasks = self._executor.submit(lambda: self.conn.table('user_plan_taskoutline').select(self.task_columns).eq('user_id', user_id)
+                                      .order('month').order('task_number').execute())
+        goal = self._executor.submit(lambda: self.conn.table('user_info').select('q2').eq('user_id', user_id).execute())
+
+        themes_rows = themes.result().data
+        if not themes_rows:
+            return None
+        goal_rows = goal.result().data
+        body = orjson.dumps({
+            "themes": themes_rows[0],
+            "tasks": tasks.result().data,
+            "user_info": {"q2": goal_rows[0].get('q2') if goal_rows else None}
+        })
+        return PlanView(body, version)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 3) if lookups else 0.0
+            }
+
+
+def conditional_response(view: PlanView, if_none_match: Optional[str], accept_encoding: Optional[str]):
+    # Returns (status, body, headers) for the Flask and Quart apps
+    headers = {
+        'ETag': view.etag,
+        # Browsers keep the copy but revalidate it on every load, which costs a 304
+        'Cache-Control': 'private, no-cache',
+        'Vary': 'Accept-Encoding, Authorization'
+    }
+    if if_none_match and view.etag in [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]:
+        return 304, b'', headers
+
+    headers['Content-Type'] = 'application/json'
+    if 'gzip' in (accept_encoding or ''):
+        headers['Content-Encoding'] = 'gzip'
+        return 200, view.gzip_body, headers
+    return 200, view.body, headers
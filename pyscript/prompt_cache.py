@@ -0,0 +1,124 @@
+import os
+import time
+import datetime
+import threading
+from typing import Optional
+import google.generativeai as genai
+from google.generativeai import caching
+from rate_limiter import estimate_tokens
+
+
+class InlinePrefixModel:
+    # Sends the prefix with every request; used when the prefix is not cached by the provider
+    def __init__(self, model_name: str, system_instruction: str, prefix: str, generation_config: Optional[dict] = None):
+        self.model = genai.GenerativeModel(model_name, system_instruction=system_instruction, generation_config=generation_config)
+        self.prefix = prefix
+
+    def generate_content(self, suffix: str, **kwargs):
+        return self.model.generate_content([self.prefix, suffix], **kwargs)
+
+    async def generate_content_async(self, suffix: str, **kwargs):
+        return await self.model.generate_content_async([self.prefix, suffix], **kwargs)
+
+
+class CachedPrefixModel:
+    # Sends only the suffix; the system instruction and prefix live in Gemini cached content
+    def __init__(self, cached_content, generation_config: Optional[dict] = None):
+        self.cached_content = cached_content
+        self.model = genai.GenerativeModel.from_cached_content(cached_content, generation_config=generation_config)
+
+    def generate_content(self, suffix: str, **kwargs):
+        return self.model.generate_content(suffix, **kwargs)
+
+    async def generate_content_async(self, suffix: str, **kwargs):
+        return await self.model.generate_content_async(suffix, **kwargs)
+
+
+class NoopPromptCache:
+    """Registers nothing: every call sends the full prefix. For tests and PROMPT_CACHE=none."""
+
+    def model_for(self, key: str, model_name: str, system_instruction: str, prefix: str,
+                  generation_config: Optional[dict] = None):
+        return InlinePrefixModel(model_name, system_instruction, prefix, generation_config)
+
+    def release(self, key: str):
+        pass
+
+    def stats(self) -> dict:
+        return {"registered": 0, "inline": 0}
+
+
+class GeminiPromptCache:
+    """Registers a shared prompt prefix once as Gemini cached content and reuses it for
+    every call with the same key (e.g. the 12 planner calls of one plan).
+
+    Gemini only caches prompts above a minimum size, so smaller prefixes, and prefixes
+    whose registration fails, are sent inline instead."""
+
+    def __init__(self, ttl_seconds: Optional[float] = None, min_prefix_tokens: Optional[int] = None):
+        self.ttl_seconds = ttl_seconds or float(os.getenv("PROMPT_CACHE_TTL", 900))
+        self.min_prefix_tokens = min_prefix_tokens if min_prefix_tokens is not None else int(os.getenv("PROMPT_CACHE_MIN_TOKENS", 32768))
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._entries = {}
+        self._registered = 0
+        self._inline = 0
+
+    def model_for(self, key: str, model_name: str, system_instruction: str, prefix: str,
+                  generation_config: Optional[dict] = None):
+        if estimate_tokens(system_instruction + prefix, 0) < self.min_prefix_tokens:
+            with self._lock:
+                self._inline += 1
+            return InlinePrefixModel(model_name, system_instruction, prefix, generation_config)
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        # Concurrent calls (e.g. hedged requests) for the same key register it only once
+        with key_lock:
+            entry = self._entries.get(key)
+            # Leave a margin so a request never starts against content that is about to expire
+            if entry is not None and entry[1] > time.time() + 30:
+                return entry[0]
+
+            try:
+                cached_content = caching.CachedContent.create(
+                    model=model_name,
+                    display_name=key[:128],
+                    system_instruction=system_instruction,
+                    contents=[prefix],
+                    ttl=datetime.timedelta(seconds=self.ttl_seconds)
+                )
+            except Exception as e:
+                print(f"Prompt cache registration failed for {key}, sending the prefix inline: {e}")
+                with self._lock:
+                    self._inline += 1
+                return InlinePrefixModel(model_name, system_instruction, prefix, generation_config)
+
+            model = CachedPrefixModel(cached_content, generation_config)
+            with self._lock:
+                self._entries[key] = (model, time.time() + self.ttl_seconds)
+                self._registered += 1
+            return model
+
+    def release(self, key: str):
+        # Deletes the cached content early instead of paying for storage until the TTL
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            self._key_locks.pop(key, None)
+        if entry is not None:
+            try:
+                entry[0].cached_content.delete()
+            except Exception as e:
+                print(f"Failed to delete cached prompt {key}: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"registered": self._registered, "inline": self._inline, "active": len(self._entries)}
+
+
+def create_prompt_cache():
+    # PROMPT_CACHE=gemini (default) or none
+    if os.getenv("PROMPT_CACHE", "gemini").lower() == "none":
+        return NoopPromptCache()
+    return GeminiPromptCache()
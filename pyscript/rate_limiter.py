@@ -0,0 +1,147 @@
+import os
+import json
+import asyncio
+import time
+import random
+import sqlite3
+import tempfile
+import threading
+from typing import Any, Optional
+
+
+class RateLimitTimeout(TimeoutError):
+    pass
+
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+
+def estimate_tokens(payload: Any, output_allowance: int = 1000) -> int:
+    # Rough Gemini estimate (~4 characters per token) plus room for the response
+    text = payload if isinstance(payload, str) else json.dumps(payload, default=str)
+    return len(text) // 4 + output_allowance
+
+
+class RateGovernor:
+    """Token-bucket admission control for Gemini shared by every worker on the host.
+
+    Bucket levels live in a SQLite file, so all gunicorn workers draw from the same
+    requests/min and tokens/min budgets. Background callers (plan generation) may not
+    dip into the reserve kept for interactive callers (/api/chat), and both queue for
+    up to their max wait before giving up."""
+
+    def __init__(self,
+                 db_path: Optional[str] = None,
+                 requests_per_minute: Optional[float] = None,
+                 tokens_per_minute: Optional[float] = None,
+                 interactive_reserve: Optional[float] = None,
+                 interactive_max_wait: Optional[float] = None,
+                 background_max_wait: Optional[float] = None):
+        self.db_path = db_path or os.getenv("GEMINI_RATE_DB", os.path.join(tempfile.gettempdir(), "athena_gemini_rate.db"))
+        self.capacity = {
+            "requests": requests_per_minute or float(os.getenv("GEMINI_RPM", 1000)),
+            "tokens": tokens_per_minute or float(os.getenv("GEMINI_TPM", 4000000)),
+        }
+        self.interactive_reserve = interactive_reserve if interactive_reserve is not None else float(os.getenv("GEMINI_INTERACTIVE_RESERVE", 0.2))
+        self.max_wait = {
+            INTERACTIVE: interactive_max_wait if interactive_max_wait is not None else float(os.getenv("GEMINI_INTERACTIVE_MAX_WAIT", 10)),
+            BACKGROUND: background_max_wait if background_max_wait is not None else float(os.getenv("GEMINI_BACKGROUND_MAX_WAIT", 60)),
+        }
+        self._local = threading.local()
+        self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self):
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, level REAL NOT NULL, updated_at REAL NOT NULL)")
+        now = time.time()
+        for name, capacity in self.capacity.items():
+            conn.execute("INSERT OR IGNORE INTO buckets (name, level, updated_at) VALUES (?, ?, ?)", (name, capacity, now))
+
+    def _levels(self, conn: sqlite3.Connection, now: float) -> dict:
+        levels = {}
+        for name, level, updated_at in conn.execute("SELECT name, level, updated_at FROM buckets"):
+            if name not in self.capacity:
+                continue
+            capacity = self.capacity[name]
+            refill = max(0.0, now - updated_at) * capacity / 60.0
+            levels[name] = min(capacity, level + refill)
+        return levels
+
+    def _try_take(self, cost: dict, priority: str) -> float:
+        # Returns 0 when admitted, otherwise the estimated seconds until enough capacity refills
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            levels = self._levels(conn, now)
+            floor = 0.0 if priority == INTERACTIVE else self.interactive_reserve
+            wait_for = 0.0
+            for name, amount in cost.items():
+                capacity = self.capacity[name]
+                # A single request larger than the floor-adjusted bucket is admitted once the bucket is full
+                needed = min(amount + floor * capacity, capacity)
+                if levels[name] < needed:
+                    wait_for = max(wait_for, (needed - levels[name]) * 60.0 / capacity)
+            if wait_for == 0.0:
+                for name, amount in cost.items():
+                    levels[name] -= amount
+            for name, level in levels.items():
+                conn.execute("UPDATE buckets SET level = ?, updated_at = ? WHERE name = ?", (level, now, name))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return wait_for
+
+    def try_acquire(self, tokens: int = 0, priority: str = BACKGROUND) -> bool:
+        return self._try_take({"requests": 1, "tokens": tokens}, priority) == 0.0
+
+    async def atry_acquire(self, tokens: int = 0, priority: str = BACKGROUND) -> bool:
+        # The SQLite transaction may wait on other workers, so it runs off the event loop
+        return await asyncio.to_thread(self.try_acquire, tokens, priority)
+
+    def _admission_delay(self, cost: dict, priority: str, start: float, max_wait: float) -> Optional[float]:
+        # None when admitted, otherwise how long to sleep before asking again
+        wait_for = self._try_take(cost, priority)
+        if wait_for == 0.0:
+            return None
+        # Interactive callers re-check more often so they win the race for refilled capacity
+        poll = min(wait_for, 0.05 if priority == INTERACTIVE else 0.25)
+        if time.monotonic() - start + poll > max_wait:
+            raise RateLimitTimeout(f"Gemini rate limit: {priority} request not admitted within {max_wait:.0f}s")
+        return poll * random.uniform(0.8, 1.2)
+
+    def acquire(self, tokens: int = 0, priority: str = BACKGROUND, max_wait: Optional[float] = None) -> float:
+        if max_wait is None:
+            max_wait = self.max_wait.get(priority, self.max_wait[BACKGROUND])
+        cost = {"requests": 1, "tokens": tokens}
+        start = time.monotonic()
+        while (delay := self._admission_delay(cost, priority, start, max_wait)) is not None:
+            time.sleep(delay)
+        return time.monotonic() - start
+
+    async def aacquire(self, tokens: int = 0, priority: str = BACKGROUND, max_wait: Optional[float] = None) -> float:
+        if max_wait is None:
+            max_wait = self.max_wait.get(priority, self.max_wait[BACKGROUND])
+        cost = {"requests": 1, "tokens": tokens}
+        start = time.monotonic()
+        while (delay := await asyncio.to_thread(self._admission_delay, cost, priority, start, max_wait)) is not None:
+            await asyncio.sleep(delay)
+        return time.monotonic() - start
+
+    def drain(self):
+        # Called on a provider 429: empty the request bucket so every worker backs off together
+        conn = self._connect()
+        conn.execute("UPDATE buckets SET level = 0, updated_at = ? WHERE name = 'requests'", (time.time(),))
+
+    async def adrain(self):
+        await asyncio.to_thread(self.drain)
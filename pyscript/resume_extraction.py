@@ -0,0 +1,130 @@
+import os
+import time
+import hashlib
+import argparse
+import threading
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from utils import init_connection, extract_file_content, select_column
+
+# Resume text is extracted in the background as soon as a resume is uploaded, so plan
+# generation only reads the stored text instead of downloading, parsing and OCR-ing the
+# file on its critical path. Extracted text is kept in the Supabase table created by
+# migrations/002_resume_text.sql; without that table every request parses the resume inline.
+#
+# Extraction is triggered by POST /resume/extract right after the upload, and
+#
+#   python resume_extraction.py --poll 30
+#
+# picks up any user_info resume that was not extracted yet (e.g. uploaded while the API was down).
+
+
+def is_extraction_error(content: str) -> bool:
+    # The utils extractors report failures as text instead of raising
+    return content.startswith("Error processing file:") or content.startswith("Error extracting")
+
+
+class ResumeExtractor:
+    def __init__(self, _conn, max_workers: int = None):
+        self._conn = _conn
+        self.executor = ThreadPoolExecutor(max_workers=max_workers or int(os.getenv("RESUME_EXTRACT_WORKERS", 2)))
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._warned = False
+
+    def _store_failed(self, action: str, error: Exception):
+        # Most likely migrations/002_resume_text.sql has not been applied; extraction still works without the table
+        if not self._warned:
+            self._warned = True
+            print(f"Could not {action} stored resume text, extracting inline: {error}")
+
+    def stored_text(self, resume_url: str):
+        try:
+            rows = self._conn.table('resume_text').select('content').eq('resume_url', resume_url).execute().data
+        except Exception as e:
+            self._store_failed("read", e)
+            return None
+        return rows[0]['content'] if rows else None
+
+    def extract_and_store(self, resume_url: str) -> str:
+        start_time = time.time()
+        content = extract_file_content(resume_url)
+        if is_extraction_error(content):
+            # Not stored, so the next request retries the extraction
+            print(f"Resume extraction failed for {resume_url}: {content}")
+            return content
+
+        try:
+            self._conn.table('resume_text').upsert({
+                'resume_url': resume_url,
+                'content': content,
+                'content_hash': hashlib.sha256(content.encode('utf-8')).hexdigest(),
+                'extracted_at': datetime.now(timezone.utc).isoformat()
+            }).execute()
+        except Exception as e:
+            self._store_failed("store", e)
+            return content
+        print(f"Extracted resume {resume_url} in {time.time() - start_time:.2f} seconds")
+        return content
+
+    def submit(self, resume_url: str):
+        # One extraction per resume at a time in this worker; already stored resumes are skipped
+        with self._lock:
+            future = self._pending.get(resume_url)
+            if future is not None:
+                return future
+            future = self.executor.submit(self._extract_if_missing, resume_url)
+            self._pending[resume_url] = future
+        future.add_done_callback(lambda _: self._release(resume_url))
+        return future
+
+    def _release(self, resume_url: str):
+        with self._lock:
+            self._pending.pop(resume_url, None)
+
+    def _extract_if_missing(self, resume_url: str) -> str:
+        content = self.stored_text(resume_url)
+        if content is not None:
+            return content
+        return self.extract_and_store(resume_url)
+
+    def get_text(self, resume_url: str) -> str:
+        if not resume_url:
+            return ""
+        content = self.stored_text(resume_url)
+        if content is not None:
+            return content
+        # Not extracted yet: join the background extraction (or start one) instead of parsing twice
+        return self.submit(resume_url).result()
+
+    def poll_new_resumes(self) -> int:
+        resume_urls = set(url for url in select_column(self._conn, 'user_info', 'resume') if url)
+        extracted = set(select_column(self._conn, 'resume_text', 'resume_url'))
+        missing = resume_urls - extracted
+        for resume_url in missing:
+            self.submit(resume_url)
+        return len(missing)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract the text of uploaded resumes ahead of plan generation.")
+    parser.add_argument('--poll', type=float, help="Keep polling user_info every N seconds")
+    parser.add_argument('--workers', type=int, help="Resumes extracted concurrently")
+    args = parser.parse_args()
+
+    load_dotenv()
+    extractor = ResumeExtractor(init_connection(), max_workers=args.workers)
+
+    while True:
+        missing = extractor.poll_new_resumes()
+        if missing:
+            print(f"Extracting {missing} new resume(s)")
+        if not args.poll:
+            extractor.executor.shutdown(wait=True)
+            return
+        time.sleep(args.poll)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+import os
+import json
+import asyncio
+import time
+import uuid
+import sqlite3
+import tempfile
+import threading
+from typing import Any, Callable, Optional, Tuple
+
+
+class SingleFlightError(RuntimeError):
+    pass
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Collapses concurrent calls that share a key into a single execution.
+
+    Duplicates inside this process wait for the leader and receive its result object.
+    Duplicates in other workers on the host see the leader's lease in a shared SQLite
+    file and wait for the JSON result it publishes when it finishes. A lease that
+    expires without a result (the leader died) is taken over by the next waiter."""
+
+    def __init__(self, db_path: Optional[str] = None, lease_seconds: Optional[float] = None, poll_interval: float = 1.0):
+        self.db_path = db_path or os.getenv("SINGLEFLIGHT_DB", os.path.join(tempfile.gettempdir(), "athena_singleflight.db"))
+        self.lease_seconds = lease_seconds or float(os.getenv("SINGLEFLIGHT_LEASE", float(os.getenv("PLAN_TIME_BUDGET", 600)) + 300))
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._acalls = {}
+        self._local = threading.local()
+        self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self):
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""CREATE TABLE IF NOT EXISTS leases (
+            key TEXT PRIMARY KEY,
+            run_id TEXT NOT NULL,
+            expires_at REAL NOT NULL,
+            finished INTEGER NOT NULL DEFAULT 0,
+            result TEXT,
+            error TEXT
+        )""")
+
+    def do(self, key: str, fn: Callable, *args, **kwargs) -> Tuple[Any, bool]:
+        # Returns (result, shared); shared is True when another caller did the work
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result, shared = self._do_leased(key, fn, args, kwargs)
+            return call.result, shared
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    def _try_lease(self, key: str) -> Tuple[bool, str]:
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT run_id, expires_at, finished FROM leases WHERE key = ?", (key,)).fetchone()
+            if row is not None and not row[2] and row[1] > now:
+                conn.execute("COMMIT")
+                return False, row[0]
+            run_id = uuid.uuid4().hex
+            conn.execute(
+                "INSERT OR REPLACE INTO leases (key, run_id, expires_at, finished, result, error) VALUES (?, ?, ?, 0, NULL, NULL)",
+                (key, run_id, now + self.lease_seconds)
+            )
+            conn.execute("COMMIT")
+            return True, run_id
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _finish(self, key: str, run_id: str, result: Any = None, error: Optional[str] = None):
+        self._connect().execute(
+            "UPDATE leases SET finished = 1, result = ?, error = ? WHERE key = ? AND run_id = ?",
+            (json.dumps(result, default=str) if error is None else None, error, key, run_id)
+        )
+
+    def _release(self, key: str, run_id: str):
+        # The leader was cancelled: expire its lease so a waiter takes over right away
+        self._connect().execute("UPDATE leases SET expires_at = 0 WHERE key = ? AND run_id = ? AND finished = 0", (key, run_id))
+
+    def _lease_state(self, key: str, run_id: str) -> Tuple[str, Any]:
+        # "done" with the leader's result, "wait" while it is still running,
+        # or "retry" when the lease was released or expired without a result
+        row = self._connect().execute(
+            "SELECT run_id, expires_at, finished, result, error FROM leases WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return "retry", None
+        current_run, expires_at, finished, result, error = row
+        if finished:
+            if error is not None:
+                raise SingleFlightError(error)
+            return "done", json.loads(result) if result is not None else None
+        if current_run != run_id or expires_at <= time.time():
+            return "retry", None
+        return "wait", None
+
+    def _do_leased(self, key: str, fn: Callable, args: tuple, kwargs: dict) -> Tuple[Any, bool]:
+        deadline = time.time() + self.lease_seconds
+        while True:
+            acquired, run_id = self._try_lease(key)
+            if acquired:
+                try:
+                    result = fn(*args, **kwargs)
+                except Exception as e:
+                    self._finish(key, run_id, error=str(e))
+                    raise
+                except BaseException:
+                    self._release(key, run_id)
+                    raise
+                self._finish(key, run_id, result=result)
+                return result, False
+
+            # Another worker holds the lease: follow it until it publishes a result or expires
+            state, value = "wait", None
+            while state == "wait":
+                if time.time() >= deadline:
+                    raise SingleFlightError(f"Timed out waiting for in-flight request {key}")
+                time.sleep(self.poll_interval)
+                state, value = self._lease_state(key, run_id)
+            if state == "done":
+                return value, True
+
+    async def ado(self, key: str, fn: Callable, *args, **kwargs) -> Tuple[Any, bool]:
+        # Async variant of do() for coroutine functions; in-process duplicates share an asyncio future
+        call = self._acalls.get(key)
+        if call is not None:
+            return await asyncio.shield(call), True
+
+        call = asyncio.get_running_loop().create_future()
+        self._acalls[key] = call
+        try:
+            result, shared = await self._ado_leased(key, fn, args, kwargs)
+            call.set_result(result)
+            return result, shared
+        except BaseException as e:
+            # In-process followers get an error rather than a CancelledError of their own
+            call.set_exception(e if isinstance(e, Exception) else SingleFlightError(f"In-flight request {key} was cancelled"))
+            raise
+        finally:
+            del self._acalls[key]
+            if not call.done():
+                call.cancel()
+            elif not call.cancelled():
+                # Mark the exception as retrieved when nobody else was waiting for it
+                call.exception()
+
+    async def _ado_leased(self, key: str, fn: Callable, args: tuple, kwargs: dict) -> Tuple[Any, bool]:
+        # SQLite calls (BEGIN IMMEDIATE may wait on other workers) run off the event loop
+        deadline = time.time() + self.lease_seconds
+        while True:
+            acquired, run_id = await asyncio.to_thread(self._try_lease, key)
+            if acquired:
+                try:
+                    result = await fn(*args, **kwargs)
+                except Exception as e:
+                    await asyncio.shield(asyncio.to_thread(self._finish, key, run_id, error=str(e)))
+                    raise
+                except BaseException:
+                    # Client disconnect or shutdown: shielded, so the lease is released even if cancelled again
+                    await asyncio.shield(asyncio.to_thread(self._release, key, run_id))
+                    raise
+                await asyncio.shield(asyncio.to_thread(self._finish, key, run_id, result=result))
+                return result, False
+
+            state, value = "wait", None
+            while state == "wait":
+                if time.time() >= deadline:
+                    raise SingleFlightError(f"Timed out waiting for in-flight request {key}")
+                await asyncio.sleep(self.poll_interval)
+                state, value = await asyncio.to_thread(self._lease_state, key, run_id)
+            if state == "done":
+                return value, True
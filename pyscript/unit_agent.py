@@ -1,7 +1,6 @@
 import os
-from typing import TypedDict, Annotated, Sequence, Tuple, List, Dict
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.prompts import ChatPromptTemplate
+import asyncio
+from typing import TypedDict, Annotated, Sequence, Tuple, List, Dict, Callable, Optional
 from langchain_core.output_parsers import JsonOutputParser
 from langgraph.graph import StateGraph, END
 from langchain_core.pydantic_v1 import BaseModel, Field
@@ -11,6 +10,20 @@ import google.generativeai as genai
 import re
 import pandas as pd
 import sys
+import hashlib
+import sqlite3
+import tempfile
+import aiosqlite
+import time
+from langchain_core.runnables import RunnableLambda
+from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+from llm_calls import LLMCaller, gemini_client_kwargs, parse_verdict
+from rate_limiter import estimate_tokens
+from prompt_cache import create_prompt_cache
+from model_router import ModelRouter
+from plan_rules import PlanRuleChecker
+from course_linking import CourseLinker, course_linking_enabled
 
 # Define the state at module level
 class State(TypedDict):
@@ -25,16 +38,35 @@ class MonthPlan(BaseModel):
     tasks: list[str] = Field(description="List of 4-5 specific, actionable tasks for the month")
 
 class PlanningAgent:
-    def __init__(self):
+    def __init__(self, llm_caller: LLMCaller = None, checkpointer=None, prompt_cache=None, model_router: ModelRouter = None,
+                 rule_checker: PlanRuleChecker = None, course_linker: CourseLinker = None):
         # Load environment variables
         load_dotenv()
 
+        # Deadlines, retries and hedging for every Gemini call
+        self.llm_caller = llm_caller or LLMCaller()
+
         # Configure Gemini
-        genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+        genai.configure(api_key=os.getenv("GOOGLE_API_KEY"), **gemini_client_kwargs())
+
+        # The Gemini model of every planner/checker call is picked by the router (model_router.py)
+        self.model_router = model_router or ModelRouter()
+        self.content_config = {"temperature": 0.7}
+        self.json_config = {"response_mime_type": "application/json"}
+
+        # The profile and resume are identical for every month of a plan, so each prompt is a
+        # cached prefix (system instruction + profile) followed by a small per-month suffix
+        self.prompt_cache = prompt_cache or create_prompt_cache()
+
+        # Mechanical checks run locally; the LLM checker only sees months the rules cannot decide.
+        # PLAN_LOCAL_CHECK=0 sends every month to the LLM checker.
+        self.rule_checker = rule_checker or PlanRuleChecker()
+        self.local_check = os.getenv("PLAN_LOCAL_CHECK", "1") != "0"
 
-        # Initialize the Gemini models
-        self.content_model = ChatGoogleGenerativeAI(model="gemini-1.5-flash-latest", temperature=0.7)
-        self.json_model = genai.GenerativeModel('gemini-1.5-flash-001', generation_config={"response_mime_type": "application/json"})
+        # Generated tasks are linked to the closest courses in our catalog (COURSE_LINKING=1, after the migration)
+        if course_linker is None and course_linking_enabled():
+            course_linker = CourseLinker()
+        self.course_linker = course_linker
 
         # Define the state
         class State(TypedDict):
@@ -52,31 +84,10 @@ class PlanningAgent:
 
         self.MonthPlan = MonthPlan
 
-        # Create the planner chain
-        self.planner_prompt = ChatPromptTemplate.from_messages([
-            ("system", "You are a career development AI assistant. Create a personalized career development plan for the given month based on the user's information, resume, and previous months' plans if any. The plan should help the user progress from their current position to their 1-year goal, addressing their challenges and ultimate aspirations."),
-            ("human", """
-    User Information:
-    Current Position: {current_position}
-    Field of Work: {field_of_work}
-    Age: {age}
-    Gender: {gender}
-    Marital Status: {marital_status}
-    Education: {education}
-    Work Experience: {work_experience}
-
-    1-Year Goal: {one_year_goal}
-
-    Challenges: {challenges}
+        # Planner prompt: the instructions, guidelines and output format are the same for every call
+        self.planner_system = """You are a career development AI assistant. Create a personalized career development plan for the given month based on the user's information, resume, and previous months' plans if any. The plan should help the user progress from their current position to their 1-year goal, addressing their challenges and ultimate aspirations.
 
-    Ultimate Aspiration: {ultimate_aspiration}
-
-    Resume Content: {resume_content}
-
-    Current Month: {current_month}
-    Previous Plans: {previous_plans}
-
-    Create a plan for month {current_month} that helps the user progress towards their 1-year goal while addressing their 
+    For the requested month, create a plan that helps the user progress towards their 1-year goal while addressing their 
     challenges and keeping their ultimate aspiration in mind. The plan should include a theme and 3-5 specific, actionable tasks.
 
     Guidelines that should be followed while creating the plan:
@@ -92,6 +103,7 @@ class PlanningAgent:
         - Do not add more than 1000 words in a single task. Make sure the tasks are under 1000 words each max.
         - Make sure all the tasks have an expected time frame for completion.
         - The total tasks for a month should be achievable and not overwhelming.
+        - If previous plans include a task status, build on completed tasks and carry forward important tasks that were not completed.
         - "No theme specified" is not a valid theme.
 
     Use the following format for plan output:
@@ -137,17 +149,26 @@ class PlanningAgent:
     (Expected time frame: 1 week)
 
     Ensure that your output follows this format and adheres to all the guidelines provided.
-        """),
-        ])
+"""
 
-        self.planner_chain = self.planner_prompt | self.content_model
+        # Checker prompt: the assessment instructions and response format are the same for every call
+        self.checker_system = """
+        Assess if the given month's plan aligns with the user's needs, addresses their challenges, and builds towards their 1-year goal and ultimate aspiration.
+        
+        Respond with a JSON object in this format:
+        {
+            "result": true or false,
+            "explanation": "Brief explanation of your assessment, including suggestions for improvement if the result is false"
+        }
+        """
 
         # Define the graph
         self.workflow = StateGraph(self.State)
 
         # Add nodes
-        self.workflow.add_node("planner", self.plan_month)
-        self.workflow.add_node("checker", self.check_plan)
+        # Each node has an async twin, used when the graph runs on an event loop (asgi.py)
+        self.workflow.add_node("planner", RunnableLambda(self.plan_month, afunc=self.aplan_month))
+        self.workflow.add_node("checker", RunnableLambda(self.check_plan, afunc=self.acheck_plan))
 
         # Add edges
         self.workflow.add_edge("planner", "checker")
@@ -159,8 +180,27 @@ class PlanningAgent:
         # Set entry point
         self.workflow.set_entry_point("planner")
 
+        # Checkpoint the graph state after every step so a failed plan can resume
+        # from the last completed month instead of starting over
+        self.checkpoint_db = os.getenv("PLAN_CHECKPOINT_DB", os.path.join(tempfile.gettempdir(), "athena_plan_checkpoints.db"))
+        if checkpointer is None:
+            checkpointer = SqliteSaver(sqlite3.connect(self.checkpoint_db, check_same_thread=False))
+        self.checkpointer = checkpointer
+        # Runs not touched for PLAN_CHECKPOINT_TTL seconds are deleted, checked at most hourly
+        self.checkpoint_ttl = float(os.getenv("PLAN_CHECKPOINT_TTL", 7 * 86400))
+        self._last_prune = 0.0
+
         # Compile the graph
-        self.app = self.workflow.compile()
+        self.app = self.workflow.compile(checkpointer=self.checkpointer)
+
+        # Async graph, compiled by asetup() on the serving event loop
+        self.aapp = None
+
+    async def asetup(self, checkpointer=None):
+        # The async graph needs an async checkpointer bound to the running event loop
+        if checkpointer is None:
+            checkpointer = AsyncSqliteSaver(await aiosqlite.connect(self.checkpoint_db))
+        self.aapp = self.workflow.compile(checkpointer=checkpointer)
 
 
     # def extract_tasks(content: str) -> List[Dict[str, str]]:
@@ -191,78 +231,152 @@ class PlanningAgent:
         
         return tasks
 
-    def plan_month(self, state: State) -> State:
+    def planner_prefix(self, state: State) -> str:
+        user_info = state['user_info']
+        return f"""
+    User Information:
+    Current Position: {user_info['current_position']}
+    Field of Work: {user_info['field_of_work']}
+    Age: {user_info['age']}
+    Gender: {user_info['gender']}
+    Marital Status: {user_info['marital_status']}
+    Education: {user_info['education']}
+    Work Experience: {user_info['work_experience']}
+
+    1-Year Goal: {user_info['q2']}
+
+    Challenges: {user_info['q3']}
+
+    Ultimate Aspiration: {user_info['q4']}
+
+    Resume Content: {state['resume_content']}
+    """
+
+    def planner_suffix(self, state: State) -> str:
         current_month = state['current_month']
         previous_plans = json.dumps(state['plan']) if state['plan'] else "No previous plans"
-        user_info = state['user_info']
-        
-        result = self.planner_chain.invoke({
-            "current_position": user_info['current_position'],
-            "field_of_work": user_info['field_of_work'],
-            "age": user_info['age'],
-            "gender": user_info['gender'],
-            "marital_status": user_info['marital_status'],
-            "education": user_info['education'],
-            "work_experience": user_info['work_experience'],
-            "one_year_goal": user_info['q2'],
-            "challenges": user_info['q3'],
-            "ultimate_aspiration": user_info['q4'],
-            "resume_content": state['resume_content'],
-            "current_month": current_month,
-            "previous_plans": previous_plans
-        })
-        
-        content = result.content
+        return f"""
+    Current Month: {current_month}
+    Previous Plans: {previous_plans}
+
+    Create a plan for month {current_month}. Ensure that your output follows the format and adheres to all the guidelines provided.
+    """
+
+    def prefix_key(self, name: str, prefix: str, model_name: str) -> str:
+        # Same profile and resume -> same key, so a resumed or retried plan reuses the registered prefix.
+        # Cached content belongs to one model, so each routed model has its own.
+        return f"{name}:{model_name}:{hashlib.sha256(prefix.encode('utf-8')).hexdigest()[:32]}"
+
+    def planner_model(self, state: State, model_name: str):
+        prefix = self.planner_prefix(state)
+        return self.prompt_cache.model_for(self.prefix_key("planner", prefix, model_name), model_name,
+                                           self.planner_system, prefix, self.content_config)
+
+    def apply_month(self, state: State, content: str) -> State:
         theme_match = re.search(r"Theme:\s*(.*)", content)
         theme = theme_match.group(1).strip() if theme_match else "No theme specified"
         
         tasks = self.extract_tasks(content)
         
-        state['plan'][f"month_{current_month}"] = {"theme": theme, "tasks": tasks}
+        state['plan'][f"month_{state['current_month']}"] = {"theme": theme, "tasks": tasks}
         return state
 
-    def check_plan(self, state: State) -> State:
-        current_month = state['current_month']
-        current_plan = state['plan'][f"month_{current_month}"]
+    def plan_month(self, state: State) -> State:
+        suffix = self.planner_suffix(state)
+        tokens = estimate_tokens(self.planner_prefix(state) + suffix)
+        attempt = self.model_router.attempt("planner", lambda model_name: self.planner_model(state, model_name).generate_content(suffix))
+        result = self.llm_caller.call("planner", attempt, tokens=tokens)
+        return self.apply_month(state, result.text)
+
+    async def aplan_month(self, state: State) -> State:
+        suffix = self.planner_suffix(state)
+        tokens = estimate_tokens(self.planner_prefix(state) + suffix)
+
+        async def generate(model_name):
+            # Registering the prefix is a blocking API call, so it runs off the event loop
+            model = await asyncio.to_thread(self.planner_model, state, model_name)
+            return await model.generate_content_async(suffix)
+
+        result = await self.llm_caller.acall("planner", self.model_router.aattempt("planner", generate), tokens=tokens)
+        return self.apply_month(state, result.text)
+
+    def checker_prefix(self, state: State) -> str:
         user_info = state['user_info']
-        
-        prompt = f"""
-        Assess if the given month's plan aligns with the user's needs, addresses their challenges, and builds towards their 1-year goal and ultimate aspiration.
-        
+        return f"""
         User Info:
         Current Position: {user_info['current_position']}
         1-Year Goal: {user_info['q2']}
         Challenges: {user_info['q3']}
         Ultimate Aspiration: {user_info['q4']}
-        
+        """
+
+    def checker_suffix(self, state: State) -> str:
+        current_month = state['current_month']
+        current_plan = state['plan'][f"month_{current_month}"]
+        return f"""
         Current Month: {current_month}
         Current Plan: {json.dumps(current_plan)}
         All Plans: {json.dumps(state['plan'])}
         
         Does this plan align with the user's needs, address their challenges, and build towards their goals? 
-        Respond with a JSON object in this format:
-        {{
-            "result": true or false,
-            "explanation": "Brief explanation of your assessment, including suggestions for improvement if the result is false"
-        }}
         """
-        
-        response = self.json_model.generate_content(prompt)
-        
+
+    def checker_model(self, state: State, model_name: str):
+        prefix = self.checker_prefix(state)
+        return self.prompt_cache.model_for(self.prefix_key("checker", prefix, model_name), model_name,
+                                           self.checker_system, prefix, self.json_config)
+
+    def apply_check(self, state: State, response_text: str) -> State:
         try:
-            result = json.loads(response.text)
+            result = json.loads(response_text)
         except json.JSONDecodeError:
-            print(f"Warning: Failed to parse JSON response. Raw response: {response.text}")
+            print(f"Warning: Failed to parse JSON response. Raw response: {response_text}")
             result = {
                 "result": True,
                 "explanation": "Unable to parse AI response. Proceeding with the current plan."
             }
-        
-        state['check_result'] = result.get('result', True)
+        return self.apply_result(state, result)
+
+    def apply_result(self, state: State, result: dict) -> State:
+        state['check_result'] = parse_verdict(result.get('result'), True)
         state['check_explanation'] = result.get('explanation', 'No explanation provided.')
         state['current_month'] += 1
         return state
 
+    def local_verdict(self, state: State):
+        # None when the LLM checker has to decide
+        if not self.local_check:
+            return None
+        verdict = self.rule_checker.check(state['plan'], state['current_month'], state['user_info'])
+        if not verdict.conclusive:
+            print(f"Local plan checks inconclusive ({'; '.join(verdict.doubts)}); asking the LLM checker")
+            return None
+        return {"result": verdict.result, "explanation": verdict.explanation()}
+
+    def check_plan(self, state: State) -> State:
+        verdict = self.local_verdict(state)
+        if verdict is not None:
+            return self.apply_result(state, verdict)
+        suffix = self.checker_suffix(state)
+        tokens = estimate_tokens(self.checker_prefix(state) + suffix, 300)
+        attempt = self.model_router.attempt("checker", lambda model_name: self.checker_model(state, model_name).generate_content(suffix))
+        response = self.llm_caller.call("checker", attempt, tokens=tokens)
+        return self.apply_check(state, response.text)
+
+    async def acheck_plan(self, state: State) -> State:
+        verdict = self.local_verdict(state)
+        if verdict is not None:
+            return self.apply_result(state, verdict)
+        suffix = self.checker_suffix(state)
+        tokens = estimate_tokens(self.checker_prefix(state) + suffix, 300)
+
+        async def check(model_name):
+            model = await asyncio.to_thread(self.checker_model, state, model_name)
+            return await model.generate_content_async(suffix)
+
+        response = await self.llm_caller.acall("checker", self.model_router.aattempt("checker", check), tokens=tokens)
+        return self.apply_check(state, response.text)
+
     def router(self, state: State) -> str:
         if state['current_month'] > 12:
             return END
@@ -270,50 +384,129 @@ class PlanningAgent:
 
     
 
-    def generate_plan(self, user_info: dict, resume_content: str) -> Tuple[pd.DataFrame, pd.DataFrame]:
-        initial_state = State(
-            user_info=user_info,
-            resume_content=resume_content,
-            current_month=1,
-            plan={}
-        )
-
-        print("Starting the career development plan generation...")
-        final_state = None
-        for output in self.app.stream(initial_state):
-            if isinstance(output, dict):
-                if 'planner' in output:
-                    current_month = output['planner']['current_month']
-                    new_month_plan = output['planner']['plan'].get(f'month_{current_month}')
-                    if new_month_plan:
-                        print(f"\nNew plan for Month {current_month}:")
-                        print(f"Theme: {new_month_plan['theme']}")
-                        print("Tasks:")
-                        for task in new_month_plan['tasks']:
-                            print(f"{task['number']}. {task['content'][:100]}...")  # Print first 100 characters of each task
-                elif 'checker' in output:
-                    print(f"\nPlan check result: {'Passed' if output['checker'].get('check_result') else 'Failed'}")
-                    print(f"Explanation: {output['checker'].get('check_explanation', 'No explanation provided.')}")
-            
-            final_state = output
+    def plan_run_id(self, user_info: dict, resume_content: str, seed_plan: dict = None) -> str:
+        # Same profile and resume -> same run, so a retried request picks up the existing checkpoints
+        fields = ['current_position', 'field_of_work', 'age', 'gender', 'marital_status',
+                  'education', 'work_experience', 'q2', 'q3', 'q4']
+        payload = json.dumps({field: user_info.get(field) for field in fields}, sort_keys=True, default=str) + resume_content
+        if seed_plan:
+            payload += json.dumps(seed_plan, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+    def touch_run(self, thread_id: str):
+        # Records when a run was last used and prunes the runs that have expired
+        now = time.time()
+        with sqlite3.connect(self.checkpoint_db, timeout=10) as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS plan_runs (thread_id TEXT PRIMARY KEY, updated_at REAL NOT NULL)")
+            conn.execute("INSERT OR REPLACE INTO plan_runs (thread_id, updated_at) VALUES (?, ?)", (thread_id, now))
+            if now - self._last_prune < 3600:
+                return
+            self._last_prune = now
+            try:
+                # Runs checkpointed before plan_runs existed start their TTL now
+                conn.execute("INSERT OR IGNORE INTO plan_runs (thread_id, updated_at) SELECT DISTINCT thread_id, ? FROM checkpoints", (now,))
+                stale = [row[0] for row in conn.execute("SELECT thread_id FROM plan_runs WHERE updated_at < ?", (now - self.checkpoint_ttl,))]
+                for table in ("writes", "checkpoints", "plan_runs"):
+                    conn.executemany(f"DELETE FROM {table} WHERE thread_id = ?", [(thread_id,) for thread_id in stale])
+            except sqlite3.OperationalError as e:
+                # The checkpointer creates its tables on first use
+                print(f"Skipped checkpoint pruning: {e}")
+                return
+        if stale:
+            print(f"Pruned {len(stale)} expired plan runs from the checkpoint store")
+
+    def stream_input(self, snapshot, initial_state: State, thread_id: str,
+                     on_month: Optional[Callable[[int, dict], None]] = None) -> Optional[State]:
+        # Only an unfinished (failed or interrupted) run is resumed: streaming None continues it.
+        # A finished run is not reused; the new input starts a fresh run on the same thread.
+        if snapshot.values and snapshot.next:
+            print(f"Resuming plan run {thread_id} at month {snapshot.values.get('current_month')}...")
+            stream_input = None
+        else:
+            if snapshot.values:
+                print(f"Plan run {thread_id} already completed. Generating a new plan...")
+            print(f"Starting the career development plan generation from month {initial_state['current_month']}...")
+            stream_input = initial_state
+
+        # Months already completed in the resumed run are delivered before any new ones
+        if on_month and stream_input is None:
+            for month, month_plan in sorted(snapshot.values.get('plan', {}).items(), key=lambda item: int(item[0].split('_')[1])):
+                month_num = int(month.split('_')[1])
+                if month_num >= initial_state['current_month']:
+                    on_month(month_num, month_plan)
+
+        return stream_input
+
+    def handle_output(self, output, on_month: Optional[Callable[[int, dict], None]] = None):
+        if isinstance(output, dict):
+            if 'planner' in output:
+                current_month = output['planner']['current_month']
+                new_month_plan = output['planner']['plan'].get(f'month_{current_month}')
+                if new_month_plan:
+                    print(f"\nNew plan for Month {current_month}:")
+                    print(f"Theme: {new_month_plan['theme']}")
+                    print("Tasks:")
+                    for task in new_month_plan['tasks']:
+                        print(f"{task['number']}. {task['content'][:100]}...")  # Print first 100 characters of each task
+                    if on_month:
+                        on_month(current_month, new_month_plan)
+            elif 'checker' in output:
+                print(f"\nPlan check result: {'Passed' if output['checker'].get('check_result') else 'Failed'}")
+                print(f"Explanation: {output['checker'].get('check_explanation', 'No explanation provided.')}")
+
+    def release_prompt_cache(self, state: State):
+        # Once the plan is complete its prefixes are no longer needed; a failed run keeps them
+        # until the TTL so that a retry can reuse them
+        for name, prefix in (("planner", self.planner_prefix(state)), ("checker", self.checker_prefix(state))):
+            for model_name in self.model_router.candidates(name):
+                self.prompt_cache.release(self.prefix_key(name, prefix, model_name))
+
+    def run_plan(self, initial_state: State, thread_id: str,
+                 on_month: Optional[Callable[[int, dict], None]] = None) -> dict:
+        config = {"configurable": {"thread_id": thread_id}}
+        self.touch_run(thread_id)
+        stream_input = self.stream_input(self.app.get_state(config), initial_state, thread_id, on_month)
+
+        with self.llm_caller.plan_budget():
+            for output in self.app.stream(stream_input, config):
+                self.handle_output(output, on_month)
+        self.release_prompt_cache(initial_state)
 
         print("\nPlan generation complete. Preparing final output...")
+        print(f"LLM call stats: {self.llm_caller.stats()}")
+        print(f"Prompt cache stats: {self.prompt_cache.stats()}")
+        print(f"Plan check stats: {self.rule_checker.stats()}")
+
+        return self.app.get_state(config).values.get('plan') or {}
+
+    async def arun_plan(self, initial_state: State, thread_id: str,
+                        on_month: Optional[Callable[[int, dict], None]] = None) -> dict:
+        if self.aapp is None:
+            await self.asetup()
+        config = {"configurable": {"thread_id": thread_id}}
+        await asyncio.to_thread(self.touch_run, thread_id)
+        stream_input = self.stream_input(await self.aapp.aget_state(config), initial_state, thread_id, on_month)
+
+        # The plan budget is a context variable, so it follows the graph's tasks on this loop
+        with self.llm_caller.plan_budget():
+            async for output in self.aapp.astream(stream_input, config):
+                self.handle_output(output, on_month)
+        await asyncio.to_thread(self.release_prompt_cache, initial_state)
 
-        themes_df = pd.DataFrame(columns=[f'month_{i}' for i in range(1, 13)])
-        tasks_df = pd.DataFrame(columns=['month', 'task_number', 'task_outline'])
+        print("\nPlan generation complete. Preparing final output...")
+        print(f"LLM call stats: {self.llm_caller.stats()}")
+        print(f"Prompt cache stats: {self.prompt_cache.stats()}")
+        print(f"Plan check stats: {self.rule_checker.stats()}")
 
-        if final_state and 'plan' in final_state:
-            plan = final_state['plan']
-        elif final_state and 'checker' in final_state and 'plan' in final_state['checker']:
-            plan = final_state['checker']['plan']
-        else:
-            print("No complete plan was generated.")
-            return pd.DataFrame(), pd.DataFrame()
+        return (await self.aapp.aget_state(config)).values.get('plan') or {}
 
+    def plan_to_frames(self, plan: dict, start_month: int = 1) -> Tuple[pd.DataFrame, pd.DataFrame]:
         themes = {}
         tasks = []
         for month, month_plan in plan.items():
             month_num = int(month.split('_')[1])
+            if month_num < start_month:
+                continue
             themes[f'month_{month_num}'] = month_plan['theme']
             for task in month_plan['tasks']:
                 tasks.append({
@@ -322,6 +515,10 @@ class PlanningAgent:
                     'task_outline': task['content']
                 })
 
+        if not themes:
+            print("No complete plan was generated.")
+            return pd.DataFrame(), pd.DataFrame()
+
         themes_df = pd.DataFrame([themes])
         tasks_df = pd.DataFrame(tasks)
 
@@ -330,6 +527,88 @@ class PlanningAgent:
         print("\nExecution complete.")
         return themes_df, tasks_df
 
+    def link_courses(self, tasks_df: pd.DataFrame) -> pd.DataFrame:
+        # Best effort: a plan without course links is still a complete plan
+        if self.course_linker is None or tasks_df.empty:
+            return tasks_df
+        outlines = tasks_df['task_outline'].tolist()
+        try:
+            links = self.llm_caller.call("course_links", self.course_linker.link, outlines, tokens=estimate_tokens("".join(outlines), 0))
+        except Exception as e:
+            print(f"Course linking failed, storing the plan without course links: {e}")
+            return tasks_df
+        tasks_df['course_links'] = pd.Series(links, index=tasks_df.index, dtype=object)
+        print(f"Linked {sum(1 for task_links in links if task_links)}/{len(links)} tasks to courses")
+        return tasks_df
+
+    def generate_plan(self, user_info: dict, resume_content: str, plan_run_id: str = None,
+                      on_month: Optional[Callable[[int, dict], None]] = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        initial_state = State(
+            user_info=user_info,
+            resume_content=resume_content,
+            current_month=1,
+            plan={}
+        )
+
+        run_id = plan_run_id or self.plan_run_id(user_info, resume_content)
+        plan = self.run_plan(initial_state, f"{user_info.get('user_id')}:{run_id}", on_month)
+        themes_df, tasks_df = self.plan_to_frames(plan)
+        return themes_df, self.link_courses(tasks_df)
+
+    async def agenerate_plan(self, user_info: dict, resume_content: str, plan_run_id: str = None,
+                             on_month: Optional[Callable[[int, dict], None]] = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        initial_state = State(
+            user_info=user_info,
+            resume_content=resume_content,
+            current_month=1,
+            plan={}
+        )
+
+        run_id = plan_run_id or self.plan_run_id(user_info, resume_content)
+        plan = await self.arun_plan(initial_state, f"{user_info.get('user_id')}:{run_id}", on_month)
+        themes_df, tasks_df = self.plan_to_frames(plan)
+        # Embedding and matching block, so they run off the event loop
+        return themes_df, await asyncio.to_thread(self.link_courses, tasks_df)
+
+    def replan_state(self, user_info: dict, resume_content: str, themes: dict, tasks: List[dict], start_month: int) -> State:
+        # Seed the state with the stored months before start_month, including how far the user got
+        # with each task, and only generate start_month..12
+        status_labels = {0: 'not_started', 1: 'in_progress', 2: 'completed'}
+        seed_plan = {}
+        for month_num in range(1, start_month):
+            month_tasks = sorted((task for task in tasks if int(task['month']) == month_num), key=lambda task: float(task['task_number']))
+            seed_plan[f"month_{month_num}"] = {
+                "theme": themes.get(f"month_{month_num}") or "No theme specified",
+                "tasks": [{
+                    'number': float(task['task_number']),
+                    'content': task['task_outline'],
+                    'status': status_labels.get(task.get('status'), 'not_started')
+                } for task in month_tasks]
+            }
+
+        return State(
+            user_info=user_info,
+            resume_content=resume_content,
+            current_month=start_month,
+            plan=seed_plan
+        )
+
+    def replan(self, user_info: dict, resume_content: str, themes: dict, tasks: List[dict], start_month: int,
+               plan_run_id: str = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        initial_state = self.replan_state(user_info, resume_content, themes, tasks, start_month)
+        run_id = plan_run_id or self.plan_run_id(user_info, resume_content, initial_state['plan'])
+        plan = self.run_plan(initial_state, f"{user_info.get('user_id')}:replan-{start_month}:{run_id}")
+        themes_df, tasks_df = self.plan_to_frames(plan, start_month)
+        return themes_df, self.link_courses(tasks_df)
+
+    async def areplan(self, user_info: dict, resume_content: str, themes: dict, tasks: List[dict], start_month: int,
+                      plan_run_id: str = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        initial_state = self.replan_state(user_info, resume_content, themes, tasks, start_month)
+        run_id = plan_run_id or self.plan_run_id(user_info, resume_content, initial_state['plan'])
+        plan = await self.arun_plan(initial_state, f"{user_info.get('user_id')}:replan-{start_month}:{run_id}")
+        themes_df, tasks_df = self.plan_to_frames(plan, start_month)
+        return themes_df, await asyncio.to_thread(self.link_courses, tasks_df)
+
 # # Usage example:
 # if __name__ == "__main__":
 #     planner = CareerDevelopmentPlanner()
@@ -11,6 +11,9 @@ import google.generativeai as genai
 import re
 import pandas as pd
 import sys
+import copy
+from llm_calls import LLMCaller, parse_verdict
+from rate_limiter import estimate_tokens
 
 # Define the state at module level
 class State(TypedDict):
@@ -21,6 +24,12 @@ class State(TypedDict):
     check_result: bool
     check_explanation: str
     check_suggestions: List[str]
+    check_score: float
+    check_flagged_tasks: List[float]
+    month_attempts: dict
+    total_attempts: int
+    best_attempts: dict
+    accepted_on_budget: List[int]
 
 # Define the output schema for the planner at module level
 class MonthPlan(BaseModel):
@@ -28,15 +37,24 @@ class MonthPlan(BaseModel):
     tasks: list[str] = Field(description="List of 4-5 specific, actionable tasks for the month")
 
 class PlanningAgent:
-    def __init__(self):
+    def __init__(self, llm_caller: LLMCaller = None, max_month_attempts: int = None, max_plan_attempts: int = None):
         # Load environment variables
         load_dotenv()
 
+        # Attempt budgets for the check/repair loop. Every month needs at least one attempt,
+        # so the plan budget only limits how many repairs can be spread across the year.
+        self.max_month_attempts = max_month_attempts or int(os.getenv("PLAN_MAX_MONTH_ATTEMPTS", 3))
+        self.max_plan_attempts = max_plan_attempts or int(os.getenv("PLAN_MAX_ATTEMPTS", 20))
+
+        # Deadlines, retries and hedging for every Gemini call
+        self.llm_caller = llm_caller or LLMCaller()
+
         # Configure Gemini
         genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
 
         # Initialize the Gemini models
-        self.content_model = ChatGoogleGenerativeAI(model="gemini-1.5-flash-latest", temperature=0.7)
+        # Retries are owned by self.llm_caller, so the client itself does not retry
+        self.content_model = ChatGoogleGenerativeAI(model="gemini-1.5-flash-latest", temperature=0.7, max_retries=1)
         self.json_model = genai.GenerativeModel('gemini-1.5-flash-001', generation_config={"response_mime_type": "application/json"})
 
         # Define the state
@@ -117,6 +135,42 @@ class PlanningAgent:
 
         self.planner_chain = self.planner_prompt | self.content_model
 
+        # Create the repair chain: rewrites only the tasks the checker flagged
+        self.repair_prompt = ChatPromptTemplate.from_messages([
+            ("system", "You are a career development AI assistant. Revise an existing monthly career development plan by rewriting only the tasks that were flagged during review. The theme and all other tasks stay exactly as they are."),
+            ("human", """
+    User Information:
+    Current Position: {current_position}
+    Field of Work: {field_of_work}
+    1-Year Goal: {one_year_goal}
+    Challenges: {challenges}
+    Ultimate Aspiration: {ultimate_aspiration}
+
+    Current Month: {current_month}
+    Month Theme: {theme}
+    Previous Plans: {previous_plans}
+
+    Tasks to keep (do not repeat or change these):
+    {kept_tasks}
+
+    Tasks to rewrite:
+    {flagged_tasks}
+
+    Suggestions for Improvement: {suggestions}
+
+    Write a replacement for each task to rewrite, keeping its task number. Replacements must fit the month's theme,
+    must not duplicate the kept tasks or previous months' tasks, and must include an expected time frame (1-4 weeks max).
+
+    Use the following format and output only the replacement tasks:
+
+    [Task Number]. **[Task Title]**
+    [Task Description]
+    (Expected time frame: X weeks)
+    """),
+        ])
+
+        self.repair_chain = self.repair_prompt | self.content_model
+
     def extract_tasks(self, content: str) -> List[Dict[str, str]]:
         tasks = []
         task_pattern = re.compile(r'(\d+)\.\s*\*\*(.*?)\*\*\s*(.*?)\(Expected time frame:\s*(.*?)\)', re.DOTALL)
@@ -133,6 +187,14 @@ class PlanningAgent:
 
     def plan_month(self, state: State) -> State:
         current_month = state['current_month']
+        month_key = f"month_{current_month}"
+        state['month_attempts'][month_key] = state['month_attempts'].get(month_key, 0) + 1
+        state['total_attempts'] += 1
+
+        # A failed month with specific flagged tasks is repaired rather than regenerated
+        if month_key in state['plan'] and state.get('check_flagged_tasks'):
+            return self.repair_month(state)
+
         previous_plans = json.dumps(state['plan']) if state['plan'] else "No previous plans"
         user_info = state['user_info']
         
@@ -143,7 +205,7 @@ class PlanningAgent:
         print(f"\nPlanning month {current_month}")
         print(f"Suggestions being incorporated: {suggestions_str}")
         
-        result = self.planner_chain.invoke({
+        inputs = {
             "current_position": user_info['current_position'],
             "field_of_work": user_info['field_of_work'],
             "age": user_info['age'],
@@ -158,7 +220,8 @@ class PlanningAgent:
             "current_month": current_month,
             "previous_plans": previous_plans,
             "suggestions": suggestions_str
-        })
+        }
+        result = self.llm_caller.call("planner", self.planner_chain.invoke, inputs, tokens=estimate_tokens(inputs))
         
         content = result.content
         theme_match = re.search(r"Theme:\s*(.*)", content)
@@ -176,6 +239,49 @@ class PlanningAgent:
         
         return state
 
+    def repair_month(self, state: State) -> State:
+        current_month = state['current_month']
+        month_key = f"month_{current_month}"
+        month_plan = state['plan'][month_key]
+        user_info = state['user_info']
+
+        flagged = set(state['check_flagged_tasks'])
+        kept_tasks = [task for task in month_plan['tasks'] if task['number'] not in flagged]
+        flagged_tasks = [task for task in month_plan['tasks'] if task['number'] in flagged]
+        previous_plans = {month: plan for month, plan in state['plan'].items() if month != month_key}
+        suggestions = state.get('check_suggestions', [])
+
+        print(f"\nRepairing {len(flagged_tasks)} flagged task(s) for month {current_month}")
+
+        inputs = {
+            "current_position": user_info['current_position'],
+            "field_of_work": user_info['field_of_work'],
+            "one_year_goal": user_info['q2'],
+            "challenges": user_info['q3'],
+            "ultimate_aspiration": user_info['q4'],
+            "current_month": current_month,
+            "theme": month_plan['theme'],
+            "previous_plans": json.dumps(previous_plans) if previous_plans else "No previous plans",
+            "kept_tasks": "\n\n".join(f"{int(task['number'])}. {task['content']}" for task in kept_tasks) or "None",
+            "flagged_tasks": "\n\n".join(f"{int(task['number'])}. {task['content']}" for task in flagged_tasks),
+            "suggestions": "\n".join(suggestions) if suggestions else "No specific suggestions."
+        }
+        result = self.llm_caller.call("repair", self.repair_chain.invoke, inputs, tokens=estimate_tokens(inputs))
+
+        # Swap in replacements by task number; a task the model skipped keeps its previous version
+        replacements = {task['number']: task for task in self.extract_tasks(result.content)}
+        month_plan['tasks'] = [
+            replacements.get(task['number'], task) if task['number'] in flagged else task
+            for task in month_plan['tasks']
+        ]
+
+        state['check_suggestions'] = []
+        state['check_flagged_tasks'] = []
+
+        print(f"Repaired tasks for month {current_month}: {sorted(int(n) for n in flagged if n in replacements)}")
+
+        return state
+
     def check_plan(self, state: State) -> State:
         current_month = state['current_month']
         current_plan = state['plan'][f"month_{current_month}"]
@@ -214,7 +320,9 @@ class PlanningAgent:
         Respond with a JSON object in this format:
         {{
             "result": true or false,
+            "score": Overall quality of the plan from 1 (poor) to 10 (excellent),
             "explanation": "Detailed explanation of your assessment, addressing each evaluation criterion",
+            "flagged_tasks": [Numbers of the tasks that must be rewritten],
             "suggestions": [
                 "Specific suggestion for improvement if needed",
                 "Another suggestion if needed"
@@ -222,27 +330,49 @@ class PlanningAgent:
         }}
         
         If the plan needs improvement, set "result" to false, provide a detailed explanation, and give specific, actionable suggestions for changes.
+        List in "flagged_tasks" only the tasks that need rewriting. Leave it empty if the theme itself has to change.
         """
         
         print(f"\nChecking plan for month {current_month}")
         
-        response = self.json_model.generate_content(prompt)
+        response = self.llm_caller.call("checker", self.json_model.generate_content, prompt, tokens=estimate_tokens(prompt, 300))
         
         try:
             result = json.loads(response.text)
         except json.JSONDecodeError:
+            # An unreadable verdict says nothing about the plan, so it is not a reason to regenerate it
             print(f"Warning: Failed to parse JSON response. Raw response: {response.text}")
             result = {
-                "result": False,
-                "explanation": "Unable to parse AI response. Plan needs revision.",
-                "suggestions": ["Please generate a new plan addressing repetition and alignment issues."]
+                "result": True,
+                "explanation": "Unable to parse AI response. Proceeding with the current plan."
             }
         
-        state['check_result'] = result.get('result', False)
+        state['check_result'] = parse_verdict(result.get('result'), False)
         state['check_explanation'] = result.get('explanation', 'No explanation provided.')
         state['check_suggestions'] = result.get('suggestions', [])
+        try:
+            state['check_score'] = float(result.get('score', 10 if state['check_result'] else 0))
+        except (TypeError, ValueError):
+            state['check_score'] = 10.0 if state['check_result'] else 0.0
+
+        task_numbers = {task['number'] for task in current_plan['tasks']}
+        flagged = []
+        for number in result.get('flagged_tasks') or []:
+            try:
+                number = float(number)
+            except (TypeError, ValueError):
+                continue
+            if number in task_numbers:
+                flagged.append(number)
+        state['check_flagged_tasks'] = [] if state['check_result'] else flagged
+
+        # Remember the best-scoring attempt so it can be accepted when the budget runs out
+        month_key = f"month_{current_month}"
+        best = state['best_attempts'].get(month_key)
+        if best is None or state['check_score'] > best['score']:
+            state['best_attempts'][month_key] = {"score": state['check_score'], "plan": copy.deepcopy(current_plan)}
         
-        print(f"Check result: {'Passed' if state['check_result'] else 'Failed'}")
+        print(f"Check result: {'Passed' if state['check_result'] else 'Failed'} (score: {state['check_score']})")
         print(f"Explanation: {state['check_explanation']}")
         if state['check_suggestions']:
             print("Suggestions for improvement:")
@@ -256,20 +386,40 @@ class PlanningAgent:
             print("All 12 months planned. Ending process.")
             return END
         
+        month_key = f"month_{state['current_month']}"
         if not state['check_result']:
-            print(f"Plan for month {state['current_month']} did not pass the check. It will be regenerated.")
-            del state['plan'][f"month_{state['current_month']}"]
-            return "planner"
+            if self.can_retry(state):
+                if state['check_flagged_tasks']:
+                    print(f"Plan for month {state['current_month']} did not pass the check. {len(state['check_flagged_tasks'])} flagged task(s) will be repaired.")
+                else:
+                    print(f"Plan for month {state['current_month']} did not pass the check. It will be regenerated.")
+                    del state['plan'][month_key]
+                return "planner"
+
+            best = state['best_attempts'][month_key]
+            state['plan'][month_key] = copy.deepcopy(best['plan'])
+            state['accepted_on_budget'].append(state['current_month'])
+            state['check_flagged_tasks'] = []
+            state['check_suggestions'] = []
+            print(f"Attempt budget for month {state['current_month']} exhausted. Accepting best attempt (score: {best['score']}).")
         
         if state['current_month'] == 12:
             print("Final month (12) planned and passed check. Ending process.")
             return END
 
         state['current_month'] += 1
-        print(f"Plan for month {state['current_month']-1} passed the check. Moving to month {state['current_month']}.")
+        print(f"Plan for month {state['current_month']-1} accepted. Moving to month {state['current_month']}.")
         return "planner"
 
-    def generate_plan(self, user_info: dict, resume_content: str) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    def can_retry(self, state: State) -> bool:
+        month_key = f"month_{state['current_month']}"
+        if state['month_attempts'].get(month_key, 0) >= self.max_month_attempts:
+            return False
+        # Keep one attempt in reserve for every month that still has to be planned
+        remaining_months = 12 - state['current_month']
+        return state['total_attempts'] + remaining_months < self.max_plan_attempts
+
+    def generate_plan(self, user_info: dict, resume_content: str, return_report: bool = False):
         initial_state = State(
             user_info=user_info,
             resume_content=resume_content,
@@ -277,27 +427,44 @@ class PlanningAgent:
             plan={},
             check_result=True,
             check_explanation="",
-            check_suggestions=[]
+            check_suggestions=[],
+            check_score=0.0,
+            check_flagged_tasks=[],
+            month_attempts={},
+            total_attempts=0,
+            best_attempts={},
+            accepted_on_budget=[]
         )
 
         print("Starting the career development plan generation...")
         final_state = initial_state
-        while final_state['current_month'] <= 12:
-            # Plan the month
-            planned_state = self.plan_month(final_state)
+        with self.llm_caller.plan_budget():
+            while final_state['current_month'] <= 12:
+                # Plan the month
+                planned_state = self.plan_month(final_state)
             
-            # Check the plan
-            checked_state = self.check_plan(planned_state)
+                # Check the plan
+                checked_state = self.check_plan(planned_state)
             
-            # Route based on the check result
-            next_step = self.router(checked_state)
+                # Route based on the check result
+                next_step = self.router(checked_state)
             
-            if next_step == END:
-                break
+                if next_step == END:
+                    break
             
-            final_state = checked_state
+                final_state = checked_state
 
         print("\nPlan generation complete. Preparing final output...")
+        print(f"LLM call stats: {self.llm_caller.stats()}")
+
+        report = {
+            "month_attempts": dict(final_state['month_attempts']),
+            "total_attempts": final_state['total_attempts'],
+            "accepted_on_budget": list(final_state['accepted_on_budget'])
+        }
+        print(f"Attempts per month: {report['month_attempts']} (total: {report['total_attempts']})")
+        if report['accepted_on_budget']:
+            print(f"Best attempt accepted after exhausting the budget for months: {report['accepted_on_budget']}")
 
         themes_df = pd.DataFrame(columns=[f'month_{i}' for i in range(1, 13)])
         tasks_df = pd.DataFrame(columns=['month', 'task_number', 'task_outline'])
@@ -306,7 +473,7 @@ class PlanningAgent:
             plan = final_state['plan']
         else:
             print("No complete plan was generated.")
-            return pd.DataFrame(), pd.DataFrame()
+            return (pd.DataFrame(), pd.DataFrame(), report) if return_report else (pd.DataFrame(), pd.DataFrame())
 
         themes = {}
         tasks = []
@@ -326,5 +493,7 @@ class PlanningAgent:
         tasks_df = tasks_df.sort_values('month')
 
         print("\nExecution complete.")
+        if return_report:
+            return themes_df, tasks_df, report
         return themes_df, tasks_df
 
@@ -1,11 +1,13 @@
 import os
 from dotenv import load_dotenv
-from supabase import create_client, Client
+from supabase import create_client, acreate_client, Client, AsyncClient
 import requests
 from docx import Document
 import fitz  # PyMuPDF
 import io
 import re
+import zipfile
+from xml.etree import ElementTree
 from pdfminer.high_level import extract_text as extract_text_pdf
 from docx import Document
 from PIL import Image
@@ -24,10 +26,47 @@ def init_connection() -> Client:
 
     return create_client(url, key)
 
+async def ainit_connection() -> AsyncClient:
+    load_dotenv()
+
+    url = os.getenv("REACT_APP_SUPABASE_URL")
+    key = os.getenv("SUPABASE_SECRET_KEY")
+
+    if not url or not key:
+        raise ValueError("Supabase URL or anon key is missing. Please check your .env file.")
+
+    return await acreate_client(url, key)
+
 def get_user_info(_conn,user_id): 
     user_info = _conn.table('user_info').select('*').eq("user_id", user_id).execute()
     return user_info.data[0]
 
+async def aget_user_info(_conn, user_id):
+    user_info = await _conn.table('user_info').select('*').eq("user_id", user_id).execute()
+    return user_info.data[0]
+
+def get_users_info(_conn, user_ids, chunk_size=200):
+    # Bulk profile fetch with one `in` filter per chunk (keeps the request URL bounded)
+    users = {}
+    user_ids = list(user_ids)
+    for i in range(0, len(user_ids), chunk_size):
+        chunk = user_ids[i:i + chunk_size]
+        response = _conn.table('user_info').select('*').in_("user_id", chunk).execute()
+        for row in response.data:
+            users[row['user_id']] = row
+    return users
+
+def select_column(_conn, table, column, page_size=1000):
+    # PostgREST caps rows per response, so page through the table
+    values = []
+    offset = 0
+    while True:
+        rows = _conn.table(table).select(column).range(offset, offset + page_size - 1).execute().data
+        values.extend(row[column] for row in rows)
+        if len(rows) < page_size:
+            return values
+        offset += page_size
+
 
 def extract_file_content(file_url: str) -> str:
     url: str = os.environ.get("REACT_APP_SUPABASE_URL")
@@ -78,6 +117,76 @@ def extract_pdf_content(file_content: bytes) -> str:
         return f"Error extracting PDF content: {str(e)}"
 
 def extract_docx_content(file_content: bytes) -> str:
+    try:
+        return "\n".join(iter_docx_text(file_content))
+    except Exception as e:
+        return f"Error extracting DOCX content: {str(e)}"
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_MC = "{http://schemas.openxmlformats.org/markup-compatibility/2006}"
+
+def iter_docx_text(file_content: bytes):
+    # Streams word/document.xml instead of building the python-docx object model.
+    # Yields each paragraph, and each table cell's text, in document order. A merged
+    # cell appears once: grid spans are a single <w:tc> already, and vertically merged
+    # continuation cells are skipped. Text box paragraphs come just before the paragraph that anchors them.
+    with zipfile.ZipFile(io.BytesIO(file_content)) as archive:
+        with archive.open('word/document.xml') as document:
+            paragraphs = []
+            cells = []
+            # Tabs and breaks are content only inside a run; <w:tab> also defines tab stops in <w:pPr>
+            runs = 0
+            # Text boxes are written twice, as <mc:Choice> and as a legacy <mc:Fallback> copy; the fallback is skipped
+            fallback = 0
+            for event, elem in ElementTree.iterparse(document, events=('start', 'end')):
+                tag = elem.tag
+                if tag == _MC + 'Fallback':
+                    fallback += 1 if event == 'start' else -1
+                    if event == 'end':
+                        elem.clear()
+                    continue
+                if fallback:
+                    continue
+                if event == 'start':
+                    if tag == _W + 'p':
+                        paragraphs.append([])
+                    elif tag == _W + 'tc':
+                        cells.append({'text': [], 'continued': False})
+                    elif tag == _W + 'r':
+                        runs += 1
+                    continue
+
+                if tag == _W + 'r':
+                    runs -= 1
+                elif tag == _W + 't':
+                    if paragraphs and elem.text:
+                        paragraphs[-1].append(elem.text)
+                elif tag == _W + 'tab':
+                    if paragraphs and runs:
+                        paragraphs[-1].append('\t')
+                elif tag in (_W + 'br', _W + 'cr'):
+                    if paragraphs and runs:
+                        paragraphs[-1].append('\n')
+                elif tag == _W + 'vMerge':
+                    if cells and elem.get(_W + 'val', 'continue') == 'continue':
+                        cells[-1]['continued'] = True
+                elif tag == _W + 'p':
+                    text = ''.join(paragraphs.pop())
+                    if cells:
+                        cells[-1]['text'].append(text)
+                    else:
+                        yield text
+                    elem.clear()
+                elif tag == _W + 'tc':
+                    cell = cells.pop()
+                    if not cell['continued']:
+                        yield '\n'.join(cell['text'])
+                    elem.clear()
+                elif tag == _W + 'tbl':
+                    elem.clear()
+
+def extract_docx_content_python_docx(file_content: bytes) -> str:
+    # Previous python-docx based extractor, kept as the baseline for benchmark_docx.py
     try:
         doc = Document(io.BytesIO(file_content))
         full_text = []
@@ -260,6 +260,13 @@ const App = () => {
   
             newAnswers.q1.resumeUrl = publicUrl;
             console.log("Resume uploaded successfully. Public URL:", publicUrl);
+
+            // Start extracting the resume text now so plan generation does not have to
+            fetch(`${process.env.REACT_APP_API_URL}/resume/extract`, {
+              method: 'POST',
+              headers: { 'Content-Type': 'application/json' },
+              body: JSON.stringify({ resume_url: publicUrl }),
+            }).catch(error => console.error("Error starting resume extraction:", error));
           }
         }
       } else if (currentStep === 'q2' || currentStep === 'q3' || currentStep === 'q4') {
@@ -348,60 +355,21 @@ const App = () => {
     //   }
     // };
     
-    const requestCareerPlan = async () => {
-      try {
-        console.log("Requesting career plan...");
-        setPlanCreationStatus('loading');
-        const response = await fetch(`${process.env.REACT_APP_API_URL}/generate_plan`, {
-          method: 'POST',
-          headers: { 
-            'Content-Type': 'application/json',
-            'Origin': 'https://athena-ai-0oc2.onrender.com'
-          },
-          body: JSON.stringify({ user_id: user.id }),
-        });
-        if (!response.ok) {
-          const errorData = await response.json();
-          throw new Error(errorData.error || `HTTP error! status: ${response.status}`);
-        }
-        const data = await response.json();
-        console.log("Career plan request successful", data);
-        checkPlanStatus();
-      } catch (err) {
-        console.error("Error requesting career plan:", err);
-        setError(`Failed to fetch career plan: ${err.message}`);
-        setPlanCreationStatus('error');
-      }
+    const requestCareerPlan = () => {
+      // PlanCreationProgress opens the plan stream and reports back when every month is stored
+      console.log("Requesting career plan...");
+      setPlanCreationStatus('loading');
     };
 
+    const handlePlanComplete = () => {
+      console.log("Career plan generated and stored");
+      setPlanCreationStatus('completed');
+    };
 
-    const checkPlanStatus = async () => {
-      try {
-        console.log("Checking plan status...");
-        const { data, error } = await supabase
-          .from('user_plan_theme')
-          .select('*')
-          .eq('user_id', user.id)
-          .single();
-    
-        if (error) {
-          if (error.code === 'PGRST116') {
-            console.log("Plan not found, checking again in 10 seconds");
-            setTimeout(checkPlanStatus, 10000);
-          } else {
-            throw error;
-          }
-        } else if (data) {
-          console.log("Plan data found:", data);
-          setPlanCreationStatus('completed');
-        } else {
-          console.log("No error, but no data either. Checking again in 10 seconds");
-          setTimeout(checkPlanStatus, 10000);
-        }
-      } catch (err) {
-        console.error("Error checking plan status:", err);
-        setError(err.message);
-      }
+    const handlePlanError = (message) => {
+      console.error("Error requesting career plan:", message);
+      setError(`Failed to fetch career plan: ${message}`);
+      setPlanCreationStatus('error');
     };
   
     if (!authChecked || loading) {
@@ -482,6 +450,8 @@ const App = () => {
                 userId={user.id}
                 planCreationStatus={planCreationStatus}
                 onRequestPlan={requestCareerPlan}
+                onPlanComplete={handlePlanComplete}
+                onPlanError={handlePlanError}
               />
             )}
           </AnimatePresence>
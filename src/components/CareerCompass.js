@@ -4,7 +4,7 @@ import { Cpu, Target, CheckSquare, ArrowRight } from 'lucide-react';
 import CareerPlanDisplay from './CareerPlanDisplay';
 import PlanCreationProgress from './PlanCreationProgress';
 
-const CareerCompass = ({ userId, planCreationStatus, onRequestPlan }) => {
+const CareerCompass = ({ userId, planCreationStatus, onRequestPlan, onPlanComplete, onPlanError }) => {
   return (
     <motion.div
       key="career-compass"
@@ -60,7 +60,7 @@ const CareerCompass = ({ userId, planCreationStatus, onRequestPlan }) => {
       )}
 
       {planCreationStatus === 'loading' && (
-        <PlanCreationProgress userId={userId} />
+        <PlanCreationProgress userId={userId} onComplete={onPlanComplete} onError={onPlanError} />
       )}
 
       {planCreationStatus === 'completed' && (
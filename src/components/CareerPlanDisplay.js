@@ -15,6 +15,12 @@ const supabase = createClient(
   }
 );
 
+// The backend only serves a plan to the signed-in user it belongs to
+const authHeaders = async () => {
+  const { data: { session } } = await supabase.auth.getSession();
+  return session ? { Authorization: `Bearer ${session.access_token}` } : {};
+};
+
 const CareerPlanDisplay = ({ userId }) => {
   const [themes, setThemes] = useState({});
   const [tasks, setTasks] = useState({});
@@ -31,26 +37,23 @@ const CareerPlanDisplay = ({ userId }) => {
       try {
         setLoading(true);
         
-        const [themeResponse, taskResponse, userInfoResponse] = await Promise.all([
-          supabase.from('user_plan_theme').select('*').eq('user_id', userId).single(),
-          supabase.from('user_plan_taskoutline').select('*').eq('user_id', userId),
-          supabase.from('user_info').select('q2').eq('user_id', userId).single()
-        ]);
+        // Themes, tasks and goal in one request; the browser revalidates its copy with the ETag
+        const response = await fetch(`${process.env.REACT_APP_API_URL}/plan/${encodeURIComponent(userId)}`, {
+          headers: await authHeaders(),
+        });
+        const plan = await response.json();
+        if (!response.ok) throw new Error(plan.error);
 
-        if (themeResponse.error) throw themeResponse.error;
-        if (taskResponse.error) throw taskResponse.error;
-        if (userInfoResponse.error) throw userInfoResponse.error;
-
-        setThemes(themeResponse.data);
-        const processedTasks = taskResponse.data.reduce((acc, task) => {
+        setThemes(plan.themes);
+        const processedTasks = plan.tasks.reduce((acc, task) => {
           if (!acc[task.month]) acc[task.month] = [];
           acc[task.month].push(task);
           return acc;
         }, {});
         setTasks(processedTasks);
-        setUserInfo(userInfoResponse.data);
+        setUserInfo(plan.user_info);
 
-        calculateProgress(taskResponse.data);
+        calculateProgress(plan.tasks);
 
       } catch (err) {
         console.error('Error fetching plan data:', err);
@@ -76,12 +79,16 @@ const CareerPlanDisplay = ({ userId }) => {
     const newStatusValue = statusMap[newStatus];
   
     try {
-      const { error } = await supabase  // Remove 'data' from here
-        .from('user_plan_taskoutline')
-        .update({ status: newStatusValue })
-        .eq('id', task.id);
-  
-      if (error) throw error;
+      // Through the backend, so the cached plan for this user is invalidated
+      const response = await fetch(
+        `${process.env.REACT_APP_API_URL}/plan/${encodeURIComponent(userId)}/tasks/${task.id}/status`,
+        {
+          method: 'POST',
+          headers: { 'Content-Type': 'application/json', ...(await authHeaders()) },
+          body: JSON.stringify({ status: newStatusValue }),
+        }
+      );
+      if (!response.ok) throw new Error((await response.json()).error);
   
       setTasks(prevTasks => {
         const updatedTasks = { ...prevTasks };
@@ -185,6 +192,23 @@ const CareerPlanDisplay = ({ userId }) => {
                 {content}
             </ReactMarkdown>
               <p className="text-sm text-gray-600 mt-2">{timeFrame}</p>
+              {task.course_links?.length > 0 && (
+                <div className="mt-3">
+                  <p className="text-sm font-semibold text-indigo-700 mb-1">Courses from our catalog</p>
+                  <ul className="list-disc pl-5 space-y-1 text-sm">
+                    {task.course_links.map((course) => (
+                      <li key={course.url}>
+                        <a href={course.url} className="text-blue-600 hover:underline" target="_blank" rel="noopener noreferrer"
+                           onClick={(e) => e.stopPropagation()}>
+                          {course.title}
+                        </a>
+                        {course.difficulty && <span className="text-gray-500"> · {course.difficulty}</span>}
+                        {course.duration && <span className="text-gray-500"> · {course.duration} hours</span>}
+                      </li>
+                    ))}
+                  </ul>
+                </div>
+              )}
               <div className="flex justify-end mt-4 space-x-2">
                 <button 
                   onClick={(e) => {
@@ -11,6 +11,8 @@ const JakeChatbot = () => {
   const [input, setInput] = useState('');
   const [isProcessing, setIsProcessing] = useState(false);
   const messagesEndRef = useRef(null);
+  // Identifies this conversation so the backend can reuse the previous turn's results for follow-ups
+  const sessionIdRef = useRef(`${Date.now()}_${Math.random().toString(36).substring(2, 15)}`);
 
   const toggleChat = () => setIsOpen(!isOpen);
   const toggleMinimize = () => setIsMinimized(!isMinimized);
@@ -44,7 +46,8 @@ const JakeChatbot = () => {
             },
             body: JSON.stringify({ 
               message: input,
-              conversation_history: conversationHistory
+              conversation_history: conversationHistory,
+              session_id: sessionIdRef.current
             }),
           });
         
@@ -1,54 +1,59 @@
 import React, { useState, useEffect } from 'react';
 import { motion } from 'framer-motion';
-import { createClient } from '@supabase/supabase-js';
 
-const supabase = createClient(
-  process.env.REACT_APP_SUPABASE_URL,
-  process.env.REACT_APP_SUPABASE_ANON_KEY
-);
+// Connection drops are retried by EventSource; give up after this many in a row
+const MAX_RECONNECTS = 5;
 
-const PlanCreationProgress = ({ userId }) => {
+const PlanCreationProgress = ({ userId, onComplete, onError }) => {
   const [progress, setProgress] = useState(0);
   const [message, setMessage] = useState('Analyzing your career goals...');
+  const [months, setMonths] = useState([]);
 
   useEffect(() => {
     let isMounted = true;
-    const checkPlanStatus = async () => {
-      try {
-        const { data, error } = await supabase
-          .from('user_plan_theme')
-          .select('*')
-          .eq('user_id', userId)
-          .single();
 
-        if (error && error.code !== 'PGRST116') {
-          throw error;
-        }
+    // Each month is pushed by the server as soon as it is generated and stored
+    const source = new EventSource(
+      `${process.env.REACT_APP_API_URL}/generate_plan/stream?user_id=${encodeURIComponent(userId)}`
+    );
 
-        if (data) {
-          if (isMounted) {
-            setProgress(100);
-          }
-        } else {
-          if (isMounted) {
-            setTimeout(checkPlanStatus, 5000); // Check every 5 seconds
-          }
-        }
-      } catch (err) {
-        console.error("Error checking plan status:", err);
+    let reconnects = 0;
+    source.addEventListener('open', () => {
+      reconnects = 0;
+    });
+
+    source.addEventListener('month', (event) => {
+      const monthPlan = JSON.parse(event.data);
+      if (isMounted) {
+        setMonths((prevMonths) => [...prevMonths.filter((m) => m.month !== monthPlan.month), monthPlan]);
+        setProgress(Math.round((monthPlan.month / 12) * 100));
       }
-    };
+    });
 
-    const interval = setInterval(() => {
+    source.addEventListener('done', () => {
+      source.close();
       if (isMounted) {
-        setProgress((prevProgress) => {
-          if (prevProgress >= 95) {
-            return 95; // Cap at 95% until plan is actually ready
-          }
-          return prevProgress + 5;
-        });
+        setProgress(100);
+        if (onComplete) onComplete();
       }
-    }, 3000);
+    });
+
+    source.addEventListener('error', (event) => {
+      // Server-sent error events carry data; connection errors do not
+      if (!event.data) {
+        // A non-SSE response (e.g. 400/500) closes the source; a dropped connection is retried
+        reconnects += 1;
+        if (source.readyState !== EventSource.CLOSED && reconnects <= MAX_RECONNECTS) return;
+        source.close();
+        console.error("Lost connection to plan generation");
+        if (isMounted && onError) onError('lost connection to the server. Please try again.');
+        return;
+      }
+      source.close();
+      const { error } = JSON.parse(event.data);
+      console.error("Error generating plan:", error);
+      if (isMounted && onError) onError(error);
+    });
 
     const messageInterval = setInterval(() => {
       if (isMounted) {
@@ -56,11 +61,9 @@ const PlanCreationProgress = ({ userId }) => {
       }
     }, 5000);
 
-    checkPlanStatus();
-
     return () => {
       isMounted = false;
-      clearInterval(interval);
+      source.close();
       clearInterval(messageInterval);
     };
   }, [userId]);
@@ -107,6 +110,21 @@ const PlanCreationProgress = ({ userId }) => {
       >
         {message}
       </motion.p>
+      {months.length > 0 && (
+        <ul className="mt-6 w-full max-w-md text-left">
+          {months.map((monthPlan) => (
+            <motion.li
+              key={monthPlan.month}
+              className="mb-2 p-3 rounded-lg bg-indigo-50 text-indigo-900"
+              initial={{ opacity: 0, y: 10 }}
+              animate={{ opacity: 1, y: 0 }}
+              transition={{ duration: 0.3 }}
+            >
+              <span className="font-semibold">Month {monthPlan.month}:</span> {monthPlan.theme}
+            </motion.li>
+          ))}
+        </ul>
+      )}
     </div>
   );
 };